@@ -0,0 +1,485 @@
+import numpy as np
+from collision import CONTACT_SLOP, ball_pairs, impact_times
+from physics import G, FRICTION, RHO, MAX_TRACK_WINDOW, TIMESTEP, MAX_SUBSTEPS, TrackGeometry, track_geometry, drag_factor
+from profiler import NULL_PROFILER
+from world import ChunkedTrack
+
+# share of their closing speed two balls bounce apart with, 0 sticks them together and 1
+# is a perfectly elastic bounce
+BALL_RESTITUTION = 0.5
+# closing speed in px/s below which balls don't bounce off each other at all
+BOUNCE_SPEED = 50
+# times a step works out the pushes between touching balls
+BALL_ITERATIONS = 4
+
+# whether each move from p0 to p1 took a point through its segment, from one side to the
+# other somewhere within its span, like physics._crossed for many moves at once
+def _crossed(p0, p1, starts, vectors):
+    before = vectors[:, 0] * (p0[:, 1] - starts[:, 1]) - vectors[:, 1] * (p0[:, 0] - starts[:, 0])
+    after = vectors[:, 0] * (p1[:, 1] - starts[:, 1]) - vectors[:, 1] * (p1[:, 0] - starts[:, 0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = before / (before - after)
+    point = p0 + (p1 - p0) * t[:, np.newaxis] - starts
+    along = np.einsum('ij, ij -> i', point, vectors)
+    return (before * after < 0) & (along >= 0) & (along <= np.einsum('ij, ij -> i', vectors, vectors))
+
+
+# structure of arrays population of balls, one entry per ball in every array
+class BallBatch:
+    def __init__(self, pos, vel, radius):
+        pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+        vel = np.broadcast_to(np.asarray(vel, dtype=float), pos.shape)
+        n = len(pos)
+
+        self.x, self.y = pos[:, 0].copy(), pos[:, 1].copy()
+        self.xvel, self.yvel = vel[:, 0].copy(), vel[:, 1].copy()
+        self.radius = np.broadcast_to(np.asarray(radius, dtype=float), (n,)).copy()
+        self.freefall = np.ones(n, dtype=bool)
+        self.on_top = np.zeros(n, dtype=bool)
+        # flat index into the track's segment arrays of the current contact, -1 in freefall
+        self.contact = np.full(n, -1)
+        # balls that left the bounds stop being stepped
+        self.active = np.ones(n, dtype=bool)
+
+    @classmethod
+    def from_balls(cls, balls):
+        return cls([(ball.x, ball.y) for ball in balls], [(ball.xvel, ball.yvel) for ball in balls],
+                   [ball.radius for ball in balls])
+
+    def __len__(self):
+        return len(self.x)
+
+
+# the Simulation physics for a whole BallBatch on one track, every phase done with
+# numpy over all the balls in it at once instead of per ball python branching. the balls
+# go through each other unless collide is set, then touching balls push apart and bounce
+# off each other. the track can be a point list, a Track, a TrackGeometry or a ChunkedTrack
+# streamed in around the balls. bounds is (width, height) from the origin or (left, top, right, bottom)
+class BatchSimulation:
+    def __init__(self, points, balls, g=G, friction=FRICTION, rho=RHO, bounds=None, continuous=True,
+                 collide=False, restitution=BALL_RESTITUTION, timestep=TIMESTEP, max_substeps=MAX_SUBSTEPS, profiler=None):
+        self.balls = balls
+        self.g = g
+        self.friction = friction
+        self.rho = rho
+        self.bounds = bounds
+        self.continuous = continuous
+        self.collide = collide
+        self.restitution = restitution
+        self.timestep = timestep
+        self.max_substeps = max_substeps
+        self.time = 0
+        self.steps = 0
+        self.profiler = profiler or NULL_PROFILER
+
+        # fixed timestep state for advance, like Simulation's
+        self.accumulator = 0
+        self.alpha = 0
+        self.prev_x, self.prev_y = balls.x.copy(), balls.y.copy()
+        # where each ball's last move started, after any push out of a line
+        self._from = np.stack((balls.x, balls.y), axis=1)
+
+        # ball pairs the broadphase handed to the exact test, how many of them touched and
+        # how often chunks were streamed in
+        self.stats = {'ball_pairs': 0, 'ball_contacts': 0, 'chunk_loads': 0}
+
+        # a ChunkedTrack only has the chunks around the balls loaded, origins holds the
+        # (stroke, first segment) each loaded curve was cut from
+        self.world = points if isinstance(points, ChunkedTrack) else None
+        self.origins = None
+        self._chunks = None
+        if self.world is not None:
+            self._stream()
+        else:
+            self._use_geometry(points if isinstance(points, TrackGeometry) else track_geometry(points))
+        self._drag = drag_factor(rho, balls.radius)
+
+        # scratch arrays _move works in, one entry per ball
+        n = len(balls)
+        self._floats = np.zeros((7, n))
+        self._flags = np.zeros((3, n), dtype=bool)
+
+    @property
+    def running(self):
+        return bool(self.balls.active.any())
+
+    def _use_geometry(self, geometry):
+        self.geometry = geometry
+        self.grid = geometry.grid
+
+        # tangent components per flat segment with a zero on the end, so the -1 contact of
+        # a ball in freefall picks up a zero tangent
+        self._tangent_x = np.append(self.grid.tangents[:, 0], 0)
+        self._tangent_y = np.append(self.grid.tangents[:, 1], 0)
+        # arc length up to the start of each flat segment counted across every curve, and
+        # the total at the end, so one search finds a window on any curve
+        self._along = np.concatenate(([0], np.cumsum(np.sqrt(self.grid.lengths_sq))))
+
+    # loads the chunks around every ball still in the run once any of them has moved into
+    # another chunk, moving rolling balls' contacts over to the same segments in the newly
+    # cut curves
+    def _stream(self):
+        b, world = self.balls, self.world
+        idx = np.flatnonzero(b.active)
+        cells = np.floor(np.stack((b.x[idx], b.y[idx]), axis=1) / world.chunk_size).astype(np.int64)
+        chunks = tuple(map(tuple, np.unique(cells, axis=0).tolist()))
+        if chunks == self._chunks:
+            return
+
+        keys = world.blocks(chunks)
+        track, origins = world.extract(keys)
+        old_origins = self.origins
+        old_grid = self.grid if old_origins is not None else None
+        self._chunks = chunks
+        self._use_geometry(track_geometry(track, None if world.version is None else (world.version, keys)))
+        self.origins = origins
+        self.stats['chunk_loads'] += 1
+
+        rolling = np.flatnonzero(b.active & ~b.freefall)
+        if old_origins is None or not len(rolling):
+            return
+
+        # (stroke, segment) of each contact packed into one number, looked up among the new segments
+        old = b.contact[rolling]
+        old_origins = old_origins[old_grid.curve[old]].astype(np.int64)
+        wanted = (old_origins[:, 0] << 32) + old_origins[:, 1] + old_grid.index[old]
+        grid = self.grid
+        new_origins = origins[grid.curve].astype(np.int64)
+        have = (new_origins[:, 0] << 32) + new_origins[:, 1] + grid.index
+        order = np.argsort(have)
+        flat = order[np.minimum(np.searchsorted(have, wanted, sorter=order), len(order) - 1)] if len(order) else old
+        found = have[flat] == wanted if len(order) else np.zeros(len(old), dtype=bool)
+
+        b.contact[rolling[found]] = flat[found]
+        lost = rolling[~found]
+        b.freefall[lost] = True
+        b.contact[lost] = -1
+
+    def step(self, dt):
+        b = self.balls
+        profiler = self.profiler
+        np.copyto(self.prev_x, b.x)
+        np.copyto(self.prev_y, b.y)
+
+        if self.world is not None:
+            with profiler.phase('stream'):
+                self._stream()
+
+        # balls are pushed apart first, so the contact search below moves any that
+        # were pushed into a line back out of it
+        if self.collide:
+            with profiler.phase('collide'):
+                self._collide()
+
+        rolling = np.flatnonzero(b.active & ~b.freefall)
+        if len(rolling):
+            with profiler.phase('local_search'):
+                self._local_search(rolling, dt)
+
+        falling = np.flatnonzero(b.active & b.freefall)
+        if len(falling):
+            with profiler.phase('broadphase'):
+                self._broadphase(falling, dt)
+
+        falling = np.flatnonzero(b.active & b.freefall)
+        start = np.stack((b.x[falling], b.y[falling]), axis=1)
+        self._from[:, 0], self._from[:, 1] = b.x, b.y
+        with profiler.phase('move'):
+            self._move(dt)
+
+        if self.continuous and len(falling):
+            with profiler.phase('sweep'):
+                self._sweep(falling, start)
+
+        self.time += dt
+        self.steps += 1
+
+        if self.bounds is not None:
+            left, top, right, bottom = self.bounds if len(self.bounds) == 4 else (0, 0, *self.bounds)
+            out = (b.x + b.radius <= left) | (b.x - b.radius >= right) | (b.y + b.radius <= top) | (b.y - b.radius >= bottom)
+            b.active &= ~out
+
+        return self.running
+
+    # steps until every ball has left the bounds or max_steps is hit, returns the steps taken
+    def run(self, dt, max_steps):
+        start = self.steps
+        while self.running and self.steps - start < max_steps:
+            self.step(dt)
+        return self.steps - start
+
+    # consumes frame time in fixed steps like Simulation.advance
+    def advance(self, frame_dt):
+        self.accumulator += frame_dt
+        substeps = 0
+        while self.running and self.accumulator >= self.timestep and substeps < self.max_substeps:
+            self.step(self.timestep)
+            self.accumulator -= self.timestep
+            substeps += 1
+
+        if substeps == self.max_substeps:
+            self.accumulator = min(self.accumulator, self.timestep)
+        self.alpha = self.accumulator / self.timestep
+        return self.running
+
+    # every ball's position blended between the last two steps for drawing, as x and y arrays
+    def render_positions(self):
+        b = self.balls
+        return self.prev_x + (b.x - self.prev_x) * self.alpha, self.prev_y + (b.y - self.prev_y) * self.alpha
+
+    # contact test of the given balls against the given segments, one pair per row
+    def _contact_test(self, center, radius, segs):
+        grid = self.grid
+        vecs = grid.vectors[segs]
+        projs = center - grid.starts[segs]
+
+        scalars = np.einsum('...i, ...i -> ...', vecs, projs) / grid.lengths_sq[segs]
+        projections = projs - vecs * scalars[..., np.newaxis]
+        distances = np.linalg.norm(projections, axis=-1)
+        mask = (distances <= radius + grid.thickness[segs]/2) & (scalars >= 0) & (scalars <= 1)
+        return mask, projections, distances
+
+    # puts the given balls in contact with the given segments, pushing them out of the line.
+    # given where their last moves started, balls whose centers went right through the
+    # segment on that move are put back out on the side they came from, like Simulation._touch
+    def _touch(self, idx, segs, center, projections, distances, before=None):
+        b, grid = self.balls, self.grid
+        if before is not None:
+            crossed = _crossed(before, center, grid.starts[segs], grid.vectors[segs])
+            center = np.where(crossed[:, np.newaxis], center - 2 * projections, center)
+            projections = np.where(crossed[:, np.newaxis], -projections, projections)
+        b.freefall[idx] = False
+        b.contact[idx] = segs
+        # y grows down the screen, so a ball is on top when its center is above the line
+        b.on_top[idx] = projections[:, 1] < 0
+
+        reach = b.radius[idx] + grid.thickness[segs]/2
+        deep = distances < reach - CONTACT_SLOP
+        idx, center, projections, distances = idx[deep], center[deep], projections[deep], distances[deep]
+        pos = center - projections + projections * ((reach[deep] - CONTACT_SLOP) / distances)[:, np.newaxis]
+        b.x[idx], b.y[idx] = pos[:, 0], pos[:, 1]
+
+    # follows rolling balls along their curves like Simulation._local_search, each one
+    # testing the segments within the arc length it can cover this step (plus its own
+    # size) either side of its last contact, and those of other curves near it. the
+    # windows differ from ball to ball, so they're laid end to end as (ball, segment) pairs
+    def _local_search(self, idx, dt):
+        b, grid, along = self.balls, self.grid, self._along
+        contact = b.contact[idx]
+        curve = grid.curve[contact]
+        reach = np.hypot(b.xvel[idx], b.yvel[idx]) * dt + b.radius[idx] + grid.thickness[contact]
+
+        start = np.maximum(np.searchsorted(along, along[contact] - reach, side='right') - 1, grid.offsets[curve])
+        end = np.minimum(np.searchsorted(along, along[contact + 1] + reach), grid.offsets[curve + 1])
+        start, end = np.maximum(start, contact - MAX_TRACK_WINDOW), np.minimum(end, contact + MAX_TRACK_WINDOW + 1)
+
+        counts = end - start
+        rows = np.repeat(np.arange(len(idx)), counts)
+        segs = np.repeat(start, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        center = np.stack((b.x[idx], b.y[idx]), axis=1)
+        mask, projections, distances = self._contact_test(center[rows], b.radius[idx][rows], segs)
+        in_window = np.bincount(rows[mask], minlength=len(idx)) > 0
+
+        # segments outside the windows, of other curves, or anywhere for balls that ran
+        # off the searched part of their own
+        near_rows, near_segs = grid.query_many(center, center, b.radius[idx])
+        keep = (((near_segs < start[near_rows]) | (near_segs >= end[near_rows])) &
+                ((grid.curve[near_segs] != curve[near_rows]) | ~in_window[near_rows]))
+        near_rows, near_segs = near_rows[keep], near_segs[keep]
+        near = self._contact_test(center[near_rows], b.radius[idx][near_rows], near_segs)
+
+        rows, segs = np.concatenate((rows, near_rows)), np.concatenate((segs, near_segs))
+        mask, projections, distances = (np.concatenate(pair) for pair in zip((mask, projections, distances), near))
+
+        # each ball's hit on the segment it has sunk deepest into, the window and then
+        # the earlier segment winning ties
+        hits = np.flatnonzero(mask)
+        depth = distances[hits] - grid.thickness[segs[hits]]/2
+        hits = hits[np.lexsort((hits, depth, rows[hits]))]
+        found_rows, first = np.unique(rows[hits], return_index=True)
+        hits = hits[first]
+        self._touch(idx[found_rows], segs[hits], center[found_rows], projections[hits], distances[hits],
+                    self._from[idx[found_rows]])
+
+        found = np.zeros(len(idx), dtype=bool)
+        found[found_rows] = True
+        lost = idx[~found]
+        b.freefall[lost] = True
+        b.contact[lost] = -1
+
+    def _broadphase(self, idx, dt):
+        b, grid = self.balls, self.grid
+        center = np.stack((b.x[idx], b.y[idx]), axis=1)
+        swept = center + np.stack((b.xvel[idx], b.yvel[idx] + self.g * dt), axis=1) * dt
+
+        pair_balls, pair_segs = grid.query_many(center, swept, b.radius[idx])
+        mask, projections, distances = self._contact_test(center[pair_balls], b.radius[idx][pair_balls], pair_segs)
+
+        # pairs come sorted by ball then segment, so the first hit per ball is the
+        # same segment the single ball scan would stop at
+        pair_balls, pair_segs = pair_balls[mask], pair_segs[mask]
+        _, first = np.unique(pair_balls, return_index=True)
+        rows = pair_balls[first]
+        self._touch(idx[rows], pair_segs[first], center[rows], projections[mask][first], distances[mask][first])
+
+    # semi-implicit euler for every active ball with the same forces as Ball.acceleration,
+    # along the track for those in contact. everything is done in place in the scratch
+    # arrays so a step doesn't allocate anything per ball
+    def _move(self, dt):
+        b, g, friction = self.balls, self.g, self.friction
+        tx, ty, along, pull, grip, ax, ay = self._floats
+        rolling, falling, still = self._flags
+
+        np.logical_not(b.freefall, out=rolling)
+        rolling &= b.active
+        np.logical_and(b.active, b.freefall, out=falling)
+
+        # velocity onto the track for the balls in contact
+        np.take(self._tangent_x, b.contact, out=tx)
+        np.take(self._tangent_y, b.contact, out=ty)
+        np.multiply(tx, b.xvel, out=along)
+        np.multiply(ty, b.yvel, out=pull)
+        along += pull
+        np.multiply(tx, along, out=pull)
+        np.copyto(b.xvel, pull, where=rolling)
+        np.multiply(ty, along, out=pull)
+        np.copyto(b.yvel, pull, where=rolling)
+
+        # gravity and drag along the track
+        np.multiply(ty, g, out=pull)
+        np.abs(along, out=ax)
+        ax *= along
+        ax *= self._drag
+        pull -= ax
+
+        # friction takes out as much as would leave each ball at rest by the end of the step,
+        # up to its grip, like Ball.acceleration. the segments are straight, so only gravity
+        # loads the track, and only for balls on top of it
+        np.abs(tx, out=grip)
+        grip *= friction * g
+        grip *= b.on_top
+        np.divide(along, dt, out=ax)
+        ax += pull
+        np.negative(ax, out=ax)
+        np.clip(ax, -grip, grip, out=ax)
+        pull += ax
+
+        np.multiply(tx, pull, out=ax)
+        np.multiply(ty, pull, out=ay)
+
+        # gravity and drag in freefall
+        np.hypot(b.xvel, b.yvel, out=grip)
+        grip *= self._drag
+        np.multiply(grip, b.xvel, out=pull)
+        np.negative(pull, out=ax, where=falling)
+        np.multiply(grip, b.yvel, out=pull)
+        np.subtract(g, pull, out=ay, where=falling)
+
+        ax *= dt
+        ay *= dt
+        np.add(b.xvel, ax, out=b.xvel, where=b.active)
+        np.add(b.yvel, ay, out=b.yvel, where=b.active)
+        np.multiply(b.xvel, dt, out=ax)
+        np.add(b.x, ax, out=b.x, where=b.active)
+        np.multiply(b.yvel, dt, out=ay)
+        np.add(b.y, ay, out=b.y, where=b.active)
+
+        # stop balls that friction took through zero and can hold there, like Ball.move
+        # they still finish this step's move
+        if friction:
+            np.multiply(tx, b.xvel, out=pull)
+            np.multiply(ty, b.yvel, out=ax)
+            pull += ax
+            pull *= along
+            np.less(pull, 0, out=still)
+            still &= rolling
+            np.abs(tx, out=ax)
+            ax *= friction
+            np.abs(ty, out=ay)
+            np.less_equal(ay, ax, out=rolling)
+            still &= rolling
+            still &= b.on_top
+            np.copyto(b.xvel, 0, where=still)
+            np.copyto(b.yvel, 0, where=still)
+
+    def _sweep(self, idx, start):
+        b, grid = self.balls, self.grid
+        end = np.stack((b.x[idx], b.y[idx]), axis=1)
+        pair_balls, pair_segs = grid.query_many(start, end, b.radius[idx])
+
+        times = impact_times(start[pair_balls], (end - start)[pair_balls], b.radius[idx][pair_balls],
+                             grid.starts[pair_segs], grid.vectors[pair_segs], grid.thickness[pair_segs],
+                             grid.normals[pair_segs], grid.lengths_sq[pair_segs])
+        first = np.full(len(idx), np.inf)
+        np.minimum.at(first, pair_balls, times)
+
+        hit = np.isfinite(first)
+        pos = start[hit] + (end[hit] - start[hit]) * first[hit][:, np.newaxis]
+        b.x[idx[hit]], b.y[idx[hit]] = pos[:, 0], pos[:, 1]
+
+    # pushes overlapping balls apart along the line between their centers and takes out the
+    # speed they're closing in on each other with, bouncing the ones that hit hard enough.
+    # they weigh as much as their volume, like drag_factor's spheres. the broadphase runs
+    # once a step and its pairs are worked through a few times, each pass adding up every
+    # pair's pushes at once, so a ball in a pile settles against all of its neighbours
+    def _collide(self):
+        b = self.balls
+        idx = np.flatnonzero(b.active)
+        i, j = ball_pairs(b.x[idx], b.y[idx], b.radius[idx])
+        self.stats['ball_pairs'] += len(i)
+        if not len(i):
+            return
+        i, j = idx[i], idx[j]
+        reach = b.radius[i] + b.radius[j]
+
+        # the lighter ball takes more of the push, i goes back along the normal and j forward
+        mass_i, mass_j = b.radius[i] ** 3, b.radius[j] ** 3
+        share_i = mass_j / (mass_i + mass_j)
+        ends = np.concatenate((i, j))
+        shares = np.concatenate((-share_i, 1 - share_i))
+        # a pass moves no ball further than this, so a crowd can't squeeze one through a line
+        limit = b.radius / (2 * BALL_ITERATIONS)
+
+        # a rolling ball can't be pushed into its line, only along it or off it, which is
+        # what holds a pile up
+        rolling = np.flatnonzero(b.active & ~b.freefall)
+        segs = b.contact[rolling]
+        normals = self.grid.normals[segs]
+        side = np.einsum('ij, ij -> i', np.stack((b.x[rolling], b.y[rolling]), axis=1) - self.grid.starts[segs], normals)
+        normals *= np.where(side < 0, -1, 1)[:, np.newaxis]
+
+        touched = np.zeros(len(i), dtype=bool)
+        for iteration in range(BALL_ITERATIONS):
+            dx, dy = b.x[j] - b.x[i], b.y[j] - b.y[i]
+            distance = np.hypot(dx, dy)
+            touching = distance < reach
+            touched |= touching
+
+            # unit normal from i to j, balls right on top of each other are split sideways
+            same = distance == 0
+            distance[same] = 1
+            dx[same], dy[same] = 1, 0
+            nx, ny = dx / distance, dy / distance
+
+            # the first pass bounces the pairs closing in fast, later ones only stop what's still closing
+            closing = np.where(touching, np.minimum((b.xvel[j] - b.xvel[i]) * nx + (b.yvel[j] - b.yvel[i]) * ny, 0), 0)
+            if iteration == 0:
+                closing *= np.where(closing < -BOUNCE_SPEED, 1 + self.restitution, 1)
+            overlap = np.where(touching, reach - distance, 0)
+
+            nx, ny = np.concatenate((nx, nx)), np.concatenate((ny, ny))
+            for xs, ys, amount, clamp in ((b.x, b.y, overlap, True), (b.xvel, b.yvel, -closing, False)):
+                weights = shares * np.concatenate((amount, amount))
+                push_x = np.bincount(ends, weights * nx, len(b))
+                push_y = np.bincount(ends, weights * ny, len(b))
+                into = np.minimum(push_x[rolling] * normals[:, 0] + push_y[rolling] * normals[:, 1], 0)
+                push_x[rolling] -= into * normals[:, 0]
+                push_y[rolling] -= into * normals[:, 1]
+                if clamp:
+                    scale = np.minimum(1, limit / np.maximum(np.hypot(push_x, push_y), 1e-12))
+                    push_x *= scale
+                    push_y *= scale
+                xs += push_x
+                ys += push_y
+        self.stats['ball_contacts'] += int(touched.sum())
@@ -0,0 +1,154 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from physics import Ball, Simulation, TrackGeometry, TIMESTEP
+
+BOUNDS = (1000, 800)
+WHITE = (255, 255, 255)
+
+# generated tracks, in the same [[thickness, color], (x, y), ...] form edit() builds.
+# each returns the point list and where the ball is dropped
+
+# one long stroke winding out from the middle, the ball rattles around inside it
+def spiral(turns=12, spacing=30, step=4, thickness=3):
+    center = np.array(BOUNDS) / 2
+    theta_max = turns * 2 * np.pi
+    # points about `step` px apart along the curve
+    length = spacing / (4 * np.pi) * theta_max ** 2
+    theta = np.sqrt(np.linspace(0, 1, int(length / step)) * theta_max ** 2)
+    r = spacing * theta / (2 * np.pi)
+    xy = center + np.column_stack((r * np.cos(theta), r * np.sin(theta)))
+    return [[[thickness, WHITE]] + [tuple(p) for p in xy.tolist()]], (center[0], center[1] - spacing / 2)
+
+# rows of tight zig-zags stepping down the screen, a lot of short segments at sharp angles
+def zigzag(rows=6, teeth=120, amplitude=8, thickness=3):
+    points = []
+    width, height = BOUNDS
+    for row in range(rows):
+        x = np.linspace(50, width - 50, teeth * 2 + 1)
+        y = 150 + row * (height - 200) / rows + (x - 50) * 0.15 * (-1) ** row
+        y[1::2] -= amplitude
+        points.append([[thickness, WHITE]] + list(zip(x.tolist(), y.tolist())))
+    return points, (80, 50)
+
+# lots of short random strokes crossing each other all over the screen
+def overlapping(strokes=3000, length=6, seed=0):
+    rng = np.random.default_rng(seed)
+    points = []
+    for _ in range(strokes):
+        start = rng.uniform((0, 100), BOUNDS)
+        walk = start + np.cumsum(rng.normal(0, 8, (length, 2)), axis=0)
+        points.append([[int(rng.integers(1, 11)), WHITE]] + [tuple(p) for p in walk.tolist()])
+    return points, (BOUNDS[0] / 2, 20)
+
+# a few very thick ramps sloping back and forth
+def thick(ramps=5, thickness=40):
+    points = []
+    width, height = BOUNDS
+    for i in range(ramps):
+        y = 120 + i * (height - 160) / ramps
+        x0, x1 = (60, width - 200) if i % 2 == 0 else (width - 60, 200)
+        x = np.linspace(x0, x1, 200)
+        points.append([[thickness, WHITE]] + list(zip(x.tolist(), (y + np.abs(x - x0) * 0.2).tolist())))
+    return points, (100, 20)
+
+TRACKS = {'spiral': spiral, 'zigzag': zigzag, 'overlapping': overlapping, 'thick': thick}
+
+# runs a track for a fixed number of steps, dropping the ball back at the start whenever
+# it leaves the screen so every step is spent on the track. points can be a TrackGeometry
+# built beforehand, so its build isn't part of the run
+def run_track(points, start, steps, dt=TIMESTEP, integrator='euler', continuous=True, radius=20, smooth=False):
+    geometry = points if isinstance(points, TrackGeometry) else TrackGeometry(points)
+    stats = {}
+    respawns = -1
+    done = 0
+    while done < steps:
+        ball = Ball(radius, start, (0, 0), None)
+        sim = Simulation(geometry, ball, bounds=BOUNDS, timestep=dt, integrator=integrator, continuous=continuous, smooth=smooth)
+        done += sim.run(dt, steps - done)
+        respawns += 1
+        for name, value in sim.stats.items():
+            stats[name] = stats.get(name, 0) + value
+    return stats, respawns
+
+# best of `repeat` timings of the geometry build (splines included for a smooth run) and
+# the run, then one more run under tracemalloc for the peak memory so tracing doesn't
+# skew the timings
+def bench_track(name, steps=5000, dt=TIMESTEP, integrator='euler', continuous=True, repeat=3, smooth=False):
+    points, start = TRACKS[name]()
+
+    build_time = run_time = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        geometry = TrackGeometry(points)
+        if smooth:
+            # the splines are only fitted the first time they're asked for
+            geometry.spline
+        build_time = min(build_time, time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        stats, respawns = run_track(geometry, start, steps, dt, integrator, continuous, smooth=smooth)
+        run_time = min(run_time, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    run_track(points, start, steps, dt, integrator, continuous, smooth=smooth)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {'track': name, 'strokes': len(points), 'segments': sum(len(sublist) - 2 for sublist in points),
+              'pieces': len(geometry.spline) if smooth else None,
+              'steps': steps, 'steps_per_s': steps / run_time, 'build_ms': build_time * 1000,
+              'peak_kb': peak / 1024, 'respawns': respawns, 'segments_per_step': stats['segments_tested'] / steps}
+    result.update(stats)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the physics on generated stress tracks.')
+    parser.add_argument('tracks', nargs='*', default=list(TRACKS), help=f'tracks to run (default: all of {list(TRACKS)})')
+    parser.add_argument('--steps', type=int, default=5000, help='physics steps per track')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per track, the best one is reported')
+    parser.add_argument('--dt', type=float, default=TIMESTEP, help='physics step in seconds')
+    parser.add_argument('--integrator', default='euler', help='euler, verlet or rk4')
+    parser.add_argument('--smooth', action='store_true', help='roll on splines fitted through the tracks')
+    parser.add_argument('--discrete', action='store_true', help='turn off the continuous collision sweep')
+    parser.add_argument('--json', metavar='FILE', help='also save the results as json, e.g. to compare against later')
+    parser.add_argument('--compare', metavar='FILE', help='results json from an earlier run to show the speedup against')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.tracks) - set(TRACKS)
+    if unknown:
+        parser.error(f'unknown tracks {sorted(unknown)}, expected some of {list(TRACKS)}')
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = {result['track']: result for result in json.load(file)}
+
+    results = []
+    print(f'{"track":<12}{"segments":>9}{"steps/s":>10}{"build ms":>10}{"peak kb":>10}{"segs/step":>10}'
+          f'{"local":>8}{"trans":>7}{"fall":>6}' + (f'{"pieces":>8}' if args.smooth else '') +
+          (f'{"speedup":>9}' if baseline else ''))
+    for name in args.tracks:
+        result = bench_track(name, args.steps, args.dt, args.integrator, not args.discrete, args.repeat, args.smooth)
+        results.append(result)
+
+        line = (f'{name:<12}{result["segments"]:>9}{result["steps_per_s"]:>10.0f}{result["build_ms"]:>10.1f}'
+                f'{result["peak_kb"]:>10.0f}{result["segments_per_step"]:>10.1f}{result["local_hits"]:>8}'
+                f'{result["transitions"]:>7}{result["fallbacks"]:>6}')
+        if args.smooth:
+            line += f'{result["pieces"]:>8}'
+        if name in baseline:
+            line += f'{result["steps_per_s"] / baseline[name]["steps_per_s"]:>8.2f}x'
+        print(line)
+        sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+import numpy as np
+
+# how far inside contact distance a ball is placed when it's put against a line, so the
+# next step's contact test still sees it touching despite float32 noise in the track points
+CONTACT_SLOP = 1e-2
+
+# uniform grid over every track segment, built once per run so the freefall
+# broadphase only has to test segments whose bounding boxes are near the ball
+class SegmentGrid:
+    def __init__(self, new_points, vectors, thicknesses, cell_size=64):
+        self.cell_size = cell_size
+
+        # flatten the per curve arrays, keeping track of where each segment came from
+        counts = [len(vecs) for vecs in vectors]
+        if sum(counts):
+            self.starts = np.concatenate([sublist[:-1] for sublist in new_points]).astype(float)
+            self.vectors = np.concatenate(vectors).astype(float)
+        else:
+            self.starts = np.zeros((0, 2))
+            self.vectors = np.zeros((0, 2))
+        self.curve = np.repeat(np.arange(len(counts)), counts)
+        self.index = np.concatenate([np.arange(n) for n in counts]) if counts else np.zeros(0, dtype=int)
+        self.thickness = np.repeat(np.asarray(thicknesses, dtype=float), counts)
+        # where each curve's segments start in the flat arrays
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(int)
+
+        # per segment geometry the contact tests would otherwise redo every step
+        self.lengths_sq = np.einsum('ij, ij -> i', self.vectors, self.vectors)
+        self.tangents = self.vectors / np.sqrt(self.lengths_sq)[:, np.newaxis]
+        self.normals = np.stack((-self.tangents[:, 1], self.tangents[:, 0]), axis=1)
+        # start, vector, squared length and half thickness side by side, so a run of
+        # segments can be read out as python floats in one go
+        self.rows = np.column_stack((self.starts, self.vectors, self.lengths_sq, self.thickness / 2))
+
+        # arc length along its curve at the start of each segment
+        total = np.concatenate(([0], np.cumsum(np.sqrt(self.lengths_sq))))
+        self.arc = total[:-1] - total[self.offsets[self.curve]]
+
+        # segment bounding boxes, padded by half the line thickness
+        pad = self.thickness[:, np.newaxis] / 2
+        self.lo = np.minimum(self.starts, self.starts + self.vectors) - pad
+        self.hi = np.maximum(self.starts, self.starts + self.vectors) + pad
+
+        # every (cell, segment) pair a bounding box covers, sorted by cell
+        c0 = np.floor(self.lo / cell_size).astype(np.int64)
+        c1 = np.floor(self.hi / cell_size).astype(np.int64)
+        nx = c1[:, 0] - c0[:, 0] + 1
+        ny = c1[:, 1] - c0[:, 1] + 1
+        cover = nx * ny
+        segs = np.repeat(np.arange(len(cover)), cover)
+        local = np.arange(cover.sum()) - np.repeat(np.cumsum(cover) - cover, cover)
+        cx = c0[segs, 0] + local % nx[segs]
+        cy = c0[segs, 1] + local // nx[segs]
+        keys = self._key(cx, cy)
+
+        order = np.lexsort((segs, keys))
+        keys = keys[order]
+        self._segs = segs[order]
+        uniq, first = np.unique(keys, return_index=True)
+        last = np.append(first[1:], len(keys))
+        self._cells = dict(zip(uniq.tolist(), zip(first.tolist(), last.tolist())))
+
+        # the same table as sorted arrays for looking up many cells at once
+        self._keys, self._first, self._last = uniq, first, last
+
+        # lowest and highest curve with a segment in each cell, so a ball rolling along one
+        # curve can skip the cells only that curve passes through
+        if len(keys):
+            curves = self.curve[self._segs]
+            ranges = zip(np.minimum.reduceat(curves, first).tolist(), np.maximum.reduceat(curves, first).tolist())
+            self._cell_curves = dict(zip(uniq.tolist(), ranges))
+        else:
+            self._cell_curves = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    @staticmethod
+    def _key(cx, cy):
+        return (cx << 32) + (cy & 0xffffffff)
+
+    # flat indices (curve major, so in the same order as the old full scan) of the
+    # segments whose boxes overlap the circle swept from p0 to p1
+    def query(self, p0, p1, radius):
+        x0, x1 = sorted((p0[0], p1[0]))
+        y0, y1 = sorted((p0[1], p1[1]))
+        cx0, cx1 = int(np.floor((x0 - radius) / self.cell_size)), int(np.floor((x1 + radius) / self.cell_size))
+        cy0, cy1 = int(np.floor((y0 - radius) / self.cell_size)), int(np.floor((y1 + radius) / self.cell_size))
+
+        found = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = self._cells.get(int(self._key(cx, cy)))
+                if cell is not None:
+                    found.append(self._segs[cell[0]:cell[1]])
+
+        if not found:
+            return np.zeros(0, dtype=int)
+        candidates = np.unique(np.concatenate(found))
+
+        # exact box test, cells are coarser than the segments they hold
+        lo, hi = self.lo[candidates], self.hi[candidates]
+        mask = (lo[:, 0] <= x1 + radius) & (hi[:, 0] >= x0 - radius) & (lo[:, 1] <= y1 + radius) & (hi[:, 1] >= y0 - radius)
+        return candidates[mask]
+
+    # flat indices of the segments of every curve but the given one whose boxes are within
+    # radius of the point, a cheaper query for a ball rolling along that curve. a segment
+    # spanning several cells can come up more than once
+    def others_near(self, point, radius, curve):
+        x, y = float(point[0]), float(point[1])
+        cx0, cx1 = int((x - radius) // self.cell_size), int((x + radius) // self.cell_size)
+        cy0, cy1 = int((y - radius) // self.cell_size), int((y + radius) // self.cell_size)
+
+        found = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                key = self._key(cx, cy)
+                cell = self._cell_curves.get(key)
+                if cell is not None and (cell[0] != curve or cell[1] != curve):
+                    first, last = self._cells[key]
+                    found.append(self._segs[first:last])
+
+        if not found:
+            return np.zeros(0, dtype=int)
+        candidates = np.concatenate(found)
+        lo, hi = self.lo[candidates], self.hi[candidates]
+        mask = ((self.curve[candidates] != curve) & (lo[:, 0] <= x + radius) & (hi[:, 0] >= x - radius) &
+                (lo[:, 1] <= y + radius) & (hi[:, 1] >= y - radius))
+        return candidates[mask]
+
+    # the same query for many balls at once, as (ball, segment) pairs sorted by ball then segment
+    def query_many(self, p0, p1, radius):
+        if not len(self):
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+        lo = np.minimum(p0, p1) - radius[:, np.newaxis]
+        hi = np.maximum(p0, p1) + radius[:, np.newaxis]
+        c0 = np.floor(lo / self.cell_size).astype(np.int64)
+        c1 = np.floor(hi / self.cell_size).astype(np.int64)
+        nx = c1[:, 0] - c0[:, 0] + 1
+        ny = c1[:, 1] - c0[:, 1] + 1
+        cover = nx * ny
+
+        # every (ball, cell) pair, then the cells that actually hold segments
+        balls = np.repeat(np.arange(len(cover)), cover)
+        local = np.arange(cover.sum()) - np.repeat(np.cumsum(cover) - cover, cover)
+        keys = self._key(c0[balls, 0] + local % nx[balls], c0[balls, 1] + local // nx[balls])
+        found = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        hit = self._keys[found] == keys
+        balls, found = balls[hit], found[hit]
+
+        # expand each cell into its segments
+        counts = self._last[found] - self._first[found]
+        pair_balls = np.repeat(balls, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_segs = self._segs[np.repeat(self._first[found], counts) + offsets]
+
+        mask = ((self.lo[pair_segs, 0] <= hi[pair_balls, 0]) & (self.hi[pair_segs, 0] >= lo[pair_balls, 0]) &
+                (self.lo[pair_segs, 1] <= hi[pair_balls, 1]) & (self.hi[pair_segs, 1] >= lo[pair_balls, 1]))
+        pairs = np.unique(pair_balls[mask] * len(self) + pair_segs[mask])
+        return pairs // len(self), pairs % len(self)
+
+
+# earliest fraction t in [0, 1] of the move from p0 to p1 at which a circle of the given
+# radius first touches the side of one of the segments, and that segment's position in
+# the arrays. only approaching hits within the segment span count, end caps are left to
+# the neighbouring segment the same way the contact test leaves them
+def time_of_impact(p0, p1, radius, starts, vectors, thickness, normals=None, lengths_sq=None):
+    if not len(starts):
+        return None, None
+
+    p0 = np.asarray(p0, dtype=float)
+    times = impact_times(p0, np.asarray(p1, dtype=float) - p0, radius, starts, vectors, thickness, normals, lengths_sq)
+    first = np.argmin(times)
+    if np.isinf(times[first]):
+        return None, None
+    return times[first], first
+
+# impact time of each move against each segment, row by row (a single move is broadcast),
+# inf where the move doesn't reach that segment. unit normals and squared lengths can be
+# passed in when the caller already has them, e.g. from a SegmentGrid
+def impact_times(p0, motion, radius, starts, vectors, thickness, normals=None, lengths_sq=None):
+    p0 = np.broadcast_to(p0, starts.shape)
+    motion = np.broadcast_to(motion, starts.shape)
+    if lengths_sq is None:
+        lengths_sq = np.einsum('ij, ij -> i', vectors, vectors)
+    if normals is None:
+        normals = np.stack((-vectors[:, 1], vectors[:, 0]), axis=1) / np.sqrt(lengths_sq)[:, np.newaxis]
+
+    # signed distance to each line now and how fast it changes over the move,
+    # aiming just inside contact distance so the contact test picks the ball up next step
+    reach = radius + thickness / 2 - CONTACT_SLOP
+    side = np.einsum('ij, ij -> i', p0 - starts, normals)
+    closing = np.einsum('ij, ij -> i', motion, normals)
+    target = np.where(side >= 0, reach, -reach)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (target - side) / closing
+    outside = np.abs(side) > reach
+    approaching = side * closing < 0
+    valid = outside & approaching & (t >= 0) & (t <= 1)
+
+    # where along the segment the ball is when it reaches the line
+    hit = p0 + motion * np.where(valid, t, 0)[:, np.newaxis]
+    along = np.einsum('ij, ij -> i', hit - starts, vectors) / lengths_sq
+    valid &= (along >= 0) & (along <= 1)
+
+    return np.where(valid, t, np.inf)
+
+
+# sweep and prune over balls' bounding boxes. the boxes are sorted by their left edge along
+# whichever axis the balls are most spread out on, so each one only has to be checked
+# against the ones starting before it ends instead of against every other ball. returns
+# the (i, j) index pairs, i < j, whose boxes overlap on both axes
+def ball_pairs(x, y, radius):
+    if len(x) < 2:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    if np.ptp(y) > np.ptp(x):
+        x, y = y, x
+
+    order = np.argsort(x - radius, kind='stable')
+    lo, hi = (x - radius)[order], (x + radius)[order]
+    ends = np.searchsorted(lo, hi, side='right')
+    counts = ends - np.arange(len(order)) - 1
+
+    a = np.repeat(np.arange(len(order)), counts)
+    b = a + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    i, j = order[a], order[b]
+    keep = np.abs(y[i] - y[j]) <= radius[i] + radius[j]
+    i, j = i[keep], j[keep]
+    return np.minimum(i, j), np.maximum(i, j)
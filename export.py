@@ -0,0 +1,225 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# frames are only ever drawn offscreen, so no window is opened even where there's a display
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+from physics import Ball, Simulation, G, FRICTION, RHO
+from render import Camera, TrackLayer
+from track import load_track
+from world import ChunkedTrack, run_bounds
+
+# matching the run screen
+SIZE = (1000, 800)
+FPS = 60
+SUBSTEPS = 4
+BACKGROUND = 'black'
+# frames handed to the encoder or png savers at once
+BATCH = 30
+
+# ffmpeg's name for the byte order of a 32 bit surface's pixels, bgr0 for the usual little
+# endian xrgb, so the pixels can be piped without converting them first
+def pixel_format(surface):
+    names = ['0'] * 4
+    for name, shift, mask in zip('rgb', surface.get_shifts(), surface.get_masks()):
+        if mask:
+            names[shift // 8] = name
+    if sys.byteorder == 'big':
+        names.reverse()
+    return ''.join(names)
+
+# collects frames' raw pixels in batches. each frame is copied once, straight out of the
+# surface into a buffer of `batch` frames that is handed on in one go when it fills up, the
+# first frame sets the size and pixel format
+class FrameBatcher:
+    def __init__(self, batch=BATCH):
+        self.batch = batch
+        self.count = 0
+        self.buffer = None
+
+    def write(self, frame):
+        width, height = frame.get_size()
+        if self.buffer is None:
+            self.buffer = np.empty((self.batch, height, width * 4), np.uint8)
+            self._start(frame)
+
+        # rows can be padded past the last pixel, the padding is left behind
+        pixels = np.frombuffer(frame.get_buffer(), np.uint8).reshape(height, frame.get_pitch())
+        self.buffer[self.count % self.batch] = pixels[:, :width * 4]
+        self.count += 1
+        if self.count % self.batch == 0:
+            self._flush(self.batch)
+
+    def close(self):
+        if self.buffer is None:
+            return
+        if self.count % self.batch:
+            self._flush(self.count % self.batch)
+        self._finish()
+
+def _save_pngs(pattern, first, size, masks, data):
+    width, height = size
+    frame = pygame.Surface(size, 0, 32, masks)
+    for k, pixels in enumerate(np.frombuffer(data, np.uint8).reshape(-1, height, width * 4)):
+        np.frombuffer(frame.get_buffer(), np.uint8).reshape(height, frame.get_pitch())[:, :width * 4] = pixels
+        pygame.image.save(frame, pattern % (first + k))
+
+# saves every frame as a numbered png, pattern is something like frames/%05d.png. png
+# compression is most of the cost, so batches are saved across a process pool while the
+# next frames are drawn, with only a few batches in flight at once to bound the memory
+class PNGSequence(FrameBatcher):
+    def __init__(self, pattern, batch=BATCH, workers=None):
+        super().__init__(batch)
+        self.pattern = pattern
+        self.workers = workers or os.cpu_count() or 1
+        self.pending = deque()
+        folder = os.path.dirname(pattern)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def _start(self, frame):
+        self.size = frame.get_size()
+        self.masks = frame.get_masks()
+        # with one core the batches are cheaper to save here than to send to another process
+        self.pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+
+    def _flush(self, frames):
+        if self.pool is None:
+            _save_pngs(self.pattern, self.count - frames, self.size, self.masks, self.buffer[:frames])
+            return
+        while len(self.pending) >= 2 * self.workers:
+            self.pending.popleft().result()
+        self.pending.append(self.pool.submit(_save_pngs, self.pattern, self.count - frames, self.size, self.masks,
+                                             self.buffer[:frames].tobytes()))
+
+    def _finish(self):
+        if self.pool is None:
+            return
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            self.pool.shutdown()
+
+# pipes frames to ffmpeg as raw video, a batch per write. ffmpeg converts the pixel format
+# instead of pygame converting every frame
+class EncoderPipe(FrameBatcher):
+    def __init__(self, path, fps=FPS, batch=BATCH, ffmpeg='ffmpeg', output_args=('-pix_fmt', 'yuv420p')):
+        super().__init__(batch)
+        self.path = path
+        self.fps = fps
+        self.ffmpeg = ffmpeg
+        self.output_args = list(output_args)
+        # ffmpeg once the first frame has started it, None before that and after it's exited
+        self.process = None
+
+    def _start(self, frame):
+        width, height = frame.get_size()
+        command = [self.ffmpeg, '-loglevel', 'error', '-y', '-f', 'rawvideo', '-pix_fmt', pixel_format(frame),
+                   '-s', f'{width}x{height}', '-r', str(self.fps), '-i', '-', *self.output_args, self.path]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def _flush(self, frames):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(self.buffer[:frames].data)
+        except BrokenPipeError as error:
+            raise RuntimeError(f'{self.ffmpeg} stopped reading frames, exited with code {self._wait()}') from error
+
+    def _finish(self):
+        if self.process is None:
+            return
+        code = self._wait()
+        if code != 0:
+            raise RuntimeError(f'{self.ffmpeg} exited with code {code}')
+
+    # closes ffmpeg's input and waits for it to exit, returns its exit code
+    def _wait(self):
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        return process.wait()
+
+# runs the ball down the track with the camera following it the way run_sim does and hands
+# every frame to writer. the sim is stepped 1/fps per frame instead of by the wall clock, so
+# frames come out as fast as they can be drawn. returns the frame count and simulated time
+def export(points, ball, writer, size=SIZE, fps=FPS, substeps=SUBSTEPS, max_time=60, g=G, friction=FRICTION, rho=RHO,
+           integrator='euler', smooth=False, background=BACKGROUND):
+    width, height = size
+    world = ChunkedTrack(points)
+    camera = Camera(size)
+    camera.center_on((ball.x, ball.y))
+
+    sim = Simulation(world, ball, g, friction, rho, bounds=run_bounds(world.bounds, camera.offset, size),
+                     timestep=1/(fps*substeps), integrator=integrator, smooth=smooth)
+
+    track_layer = TrackLayer(size, background, smooth=smooth)
+    track_layer.redraw(points)
+    frame = pygame.Surface(size, 0, 32)
+
+    dt = 1 / fps
+    frames = 0
+    max_frames = int(round(max_time * fps))
+    while frames < max_frames:
+        pos = sim.render_position()
+        camera.follow(pos, dt)
+        track_layer.view(camera.offset)
+        frame.blit(track_layer.surface, (0, 0))
+        pygame.draw.circle(frame, ball.color, camera.to_screen(pos), ball.radius)
+        writer.write(frame)
+        frames += 1
+
+        if not sim.advance(dt):
+            break
+    return frames, sim.time
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render a run offscreen to a png sequence or a video, faster than real time.')
+    parser.add_argument('track', help='track file saved from the edit screen')
+    parser.add_argument('out', help='png pattern like frames/%%05d.png, anything else is encoded with ffmpeg, e.g. run.mp4')
+    parser.add_argument('--pos', type=float, nargs=2, required=True, metavar=('X', 'Y'), help='where the ball starts')
+    parser.add_argument('--vel', type=float, nargs=2, default=(0, 0), metavar=('XVEL', 'YVEL'), help='starting velocity')
+    parser.add_argument('--radius', type=float, default=20, help='ball radius')
+    parser.add_argument('--color', default='white', help='ball color, a name or #rrggbb')
+    parser.add_argument('--g', type=float, default=G, help='gravity')
+    parser.add_argument('--friction', type=float, default=FRICTION, help='friction coefficient')
+    parser.add_argument('--rho', type=float, default=RHO, help='air density')
+    parser.add_argument('--fps', type=int, default=FPS, help='frames per simulated second')
+    parser.add_argument('--substeps', type=int, default=SUBSTEPS, help='physics steps per frame')
+    parser.add_argument('--size', type=int, nargs=2, default=SIZE, metavar=('WIDTH', 'HEIGHT'), help='frame size')
+    parser.add_argument('--max-time', type=float, default=60, help='simulated seconds before the export is cut off')
+    parser.add_argument('--integrator', default='euler', help='euler, verlet or rk4')
+    parser.add_argument('--smooth', action='store_true', help='roll on splines fitted through the track')
+    parser.add_argument('--batch', type=int, default=BATCH, help='frames handed to the encoder or png savers at once')
+    parser.add_argument('--workers', type=int, default=None, help='processes saving pngs (default: one per core)')
+    parser.add_argument('--ffmpeg', default='ffmpeg', help='encoder to pipe raw frames to')
+    args = parser.parse_args(argv)
+
+    points = load_track(args.track)
+    ball = Ball(args.radius, args.pos, args.vel, pygame.Color(args.color))
+    if '%' in args.out:
+        writer = PNGSequence(args.out, args.batch, args.workers)
+    else:
+        writer = EncoderPipe(args.out, args.fps, args.batch, args.ffmpeg)
+
+    start = time.perf_counter()
+    try:
+        frames, sim_time = export(points, ball, writer, tuple(args.size), args.fps, args.substeps, args.max_time,
+                                  args.g, args.friction, args.rho, args.integrator, args.smooth)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    print(f'{frames} frames, {sim_time:.2f} s of run in {elapsed:.2f} s ({sim_time / elapsed:.1f}x real time)')
+
+if __name__ == '__main__':
+    main()
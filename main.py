@@ -1,7 +1,16 @@
+import atexit
 import pygame
 import pygame_gui
-import json
-import numpy as np
+from physics import Ball, Simulation
+from batch import BallBatch, BatchSimulation
+from track import save_track, load_track
+from render import Camera, TrackLayer, draw_profiler
+from strokes import StrokeIndex, StrokeBuilder, erase
+from replay import Recorder
+from worker import PhysicsWorker
+from world import ChunkedTrack, run_bounds
+from profiler import Profiler
+from settings import Settings
 
 pygame.init()
 
@@ -16,593 +25,759 @@ manager = pygame_gui.UIManager((WIDTH, HEIGHT), theme_path='theme.json')
 # fonts
 TITLE_FONT = pygame.font.Font('bitcount.ttf', 75)
 MAIN_FONT = pygame.font.Font('main_font.ttf', 18)
+DEBUG_FONT = pygame.font.Font('main_font.ttf', 12)
 
 # sim constants
 bg_color = 'black'
 FPS = 60
+SUBSTEPS = 4
+INTEGRATOR = 'euler'
+# roll on splines fitted through each stroke instead of its straight segments
+SMOOTH = False
+# step runs on a thread of their own instead of at the start of each frame. the step holds
+# the GIL, so this doesn't run physics in parallel and frame pacing isn't reliably better, off by default
+PHYSICS_THREAD = False
 clock = pygame.time.Clock()
-g = 1000
-friction = 0
-rho = 0
-
-class Ball:
-    def __init__(self, radius, pos, vel, color):
-        self.radius = radius
-        self.x, self.y = pos
-        self.xvel, self.yvel = vel
-        self.color = color
-        self.freefall = True
-        self.checkpoint = None
-        self.tangent_vector = None
-        self.on_top = None
-
-    def move(self, dt):
-        if self.freefall:
-            self.yvel += g * dt
-        else:
-            self.tangent_vector = self.tangent_vector / np.linalg.norm(self.tangent_vector)
-            acc = self.tangent_vector * np.dot(self.tangent_vector, [0, g])
-            vel = np.array([self.xvel, self.yvel])
-
-            # if np.dot(vel, self.tangent_vector) > 0:
-            #     self.xvel, self.yvel = self.tangent_vector * np.linalg.norm(vel)
-            # elif np.dot(vel, self.tangent_vector) < 0:
-            #     self.xvel, self.yvel = self.tangent_vector * -np.linalg.norm(vel)
-            # else:
-            #     self.xvel, self.yvel = 0, 0
-
-            tangent_vel = self.tangent_vector * np.dot(self.tangent_vector, vel)
-            tangent_vel += acc * dt
-            
-            self.xvel, self.yvel = tangent_vel
-
-        self.x += self.xvel * dt
-        self.y += self.yvel * dt
-        
 
+# the edit screen's last values, loaded once here and saved in the background as they change
+settings = Settings('settings.json', {'tool_size': 3, 'line_color': [255, 255, 255], 'ball_radius': 20,
+                                      'ball_color': [255, 255, 255], 'friction': 0, 'gravity': 1000, 'air_density': 0})
+atexit.register(settings.close)
+g = settings['gravity']
+friction = settings['friction']
+rho = settings['air_density']
+
+# where ctrl+s / ctrl+o save and load the track
+TRACK_FILE = 'track.trk'
+
+# how fast the arrow keys scroll the edit view, in px/s
+PAN_SPEED = 600
+
+# frame phase timings, F3 shows them over the screen and F4 writes them to
+# profile.csv (every kept frame) and profile.json (averages and counters)
+profiler = Profiler()
+show_profiler = False
+PROFILE_FILE = 'profile'
+
+def profiler_keys(event, counters=None):
+    global show_profiler
+    if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+        show_profiler = not show_profiler
+    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+        profiler.export(PROFILE_FILE + '.csv')
+        profiler.export(PROFILE_FILE + '.json', counters)
+
+# recolors one of the color buttons straight away, the theme file is left alone
+def tint_button(button, color):
+    hover_color = pygame.Color(color)
+    if color.r >= 20 and color.g >= 20 and color.b >= 20:
+        hover_color = pygame.Color(color.r - 20, color.g - 20, color.b - 20)
+    button.colours['normal_bg'] = pygame.Color(color)
+    button.colours['hovered_bg'] = hover_color
+    button.rebuild()
+
+# shown on the help screen
+HELP_TEXT = '''Thanks for checking out this physics sandbox. As of July 2025, there is one simulation under development, but I may add more later if time permits. To start the simulation, click the start button located in the menu. There are two modes: <font color="#ffff00">edit</font>, which can be enabled by pressing "Escape," allowing you to set initial conditions of the simulation; and <font color="#ffff00">run</font>, which can be enabled by pressing "Enter," running the simulation. In edit mode, the arrow keys scroll around the world, the "Ball" tool drops more balls that bump into each other (the eraser removes them), "Ctrl+S" saves your track, "Ctrl+O" loads it back and "P" replays the last run (arrow keys to seek and change speed, space to pause). "F3" shows frame timings and "F4" saves them to profile.csv and profile.json. Hopefully that helps. Have fun!'''
 
 # help screen
-def help(screen):
+class HelpScreen:
+    def __init__(self):
+        self.help_screen = pygame_gui.elements.UIPanel(relative_rect=pygame.Rect(0, 0, WIDTH, HEIGHT), manager=manager)
+        text_width, text_height = 700, 350
+        pygame_gui.elements.UITextBox(html_text=HELP_TEXT,
+                                      relative_rect=pygame.Rect((WIDTH - text_width)/2, (HEIGHT - text_height)/2, text_width, text_height),
+                                      manager=manager,
+                                      container=self.help_screen)
+
+        button_width, button_height = 100, 50
+        self.back_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(20, 20, button_width, button_height),
+                                                        text='< Back',
+                                                        manager=manager,
+                                                        object_id='#back_button',
+                                                        container=self.help_screen)
+        self.help_screen.hide()
+
+    def run(self):
+        self.help_screen.show()
+        run = True
+        next_screen = None
+
+        while run:
+            dt = clock.tick(FPS)/1000
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    run = False
+                    break
+
+                if event.type == pygame_gui.UI_BUTTON_PRESSED and event.ui_element == self.back_button:
+                    next_screen = 'menu'
+                    run = False
+                    break
+
+                manager.process_events(event)
+
+            WIN.fill(bg_color)
+            manager.update(dt)
+            manager.draw_ui(WIN)
+            pygame.display.update()
+
+        self.help_screen.hide()
+        return next_screen
+
+# run sim
+def run_sim(points, ball, back_button, view=(0, 0), world=None, recorder=None, balls=()):
     run = True
+    back = False
+    world = world or ChunkedTrack(points)
+    bounds = run_bounds(world.bounds, view, (WIDTH, HEIGHT))
+
+    # extra balls go in one batch with the main one, which also collides them with each
+    # other. it always steps with semi-implicit euler on the straight segments, and isn't recorded
+    crowd = [ball, *balls]
+    if balls:
+        sim = BatchSimulation(world, BallBatch.from_balls(crowd), g, friction, rho, bounds=bounds,
+                              collide=True, timestep=1/(FPS*SUBSTEPS), profiler=profiler)
+    else:
+        sim = Simulation(world, ball, g, friction, rho, bounds=bounds,
+                         timestep=1/(FPS*SUBSTEPS), integrator=INTEGRATOR, recorder=recorder, profiler=profiler, smooth=SMOOTH)
+    worker = None
+    if PHYSICS_THREAD:
+        worker = PhysicsWorker(sim)
+        worker.start()
+
+    # the view starts where the edit screen was and follows the ball from there
+    camera = Camera((WIDTH, HEIGHT), *view)
+
+    # the track doesn't change during a run, so while the view stays put only the areas
+    # around the balls and the back button are pushed to the display each frame. it's drawn
+    # as the curves the ball rolls on, which a batch of balls doesn't do
+    track_layer = TrackLayer((WIDTH, HEIGHT), bg_color, smooth=SMOOTH and not balls)
+    track_layer.redraw(points)
+    track_layer.view(camera.offset)
+    WIN.blit(track_layer.surface, (0, 0))
+    ball_rects = []
+    overlay_rect = None
+    full_update = True
 
-    # UI elements
-    help_screen = pygame_gui.elements.UIPanel(relative_rect=pygame.Rect(0, 0, WIDTH, HEIGHT), manager=manager)
-    text_width, text_height = 700, 350
-    help_text = pygame_gui.elements.UITextBox(html_text='''Thanks for checking out this physics sandbox. As of July 2025, there is one simulation under development, but I may add more later if time permits. To start the simulation, click the start button located in the menu. There are two modes: <font color="#ffff00">edit</font>, which can be enabled by pressing "Escape," allowing you to set initial conditions of the simulation; and <font color="#ffff00">run</font>, which can be enabled by pressing "Enter," running the simulation. Hopefully that helps. Have fun!''',
-                                              relative_rect=pygame.Rect((WIDTH - text_width)/2, (HEIGHT - text_height)/2, text_width, text_height),
-                                              manager=manager,
-                                              container=help_screen)
-    
-    button_width, button_height = 100, 50
-    back_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(20, 20, button_width, button_height),
-                                               text='< Back',
-                                               manager=manager,
-                                               object_id='#back_button',
-                                               container=help_screen)
-    
     while run:
         dt = clock.tick(FPS)/1000
+        profiler.frame()
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                # the screen that started this one quits
+                pygame.event.post(event)
                 run = False
-                pygame.quit()
                 break
 
-            if event.type == pygame_gui.UI_BUTTON_PRESSED and event.ui_element == back_button:
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                 run = False
-                help_screen.hide()
-                screen.show()
+                break
+            
+            elif event.type == pygame_gui.UI_BUTTON_PRESSED and event.ui_element == back_button:
+                run = False
+                back = True
                 break
 
+            profiler_keys(event, sim.stats)
             manager.process_events(event)
+        profiler.lap('events')
+
+        # physics, a threaded run is already stepping on its own
+        if not (worker.running if worker is not None else sim.advance(dt)):
+            run = False
+            ball.x = 0
+            ball.y = 0
+            ball.xvel = 0
+            ball.yvel = 0
+        profiler.lap('physics')
+
+        # draw, following the first ball still in the run
+        if worker is not None:
+            xs, ys, active = worker.positions()
+            drawn = [(crowd[k], (xs[k], ys[k])) for k in active.nonzero()[0]]
+        elif balls:
+            xs, ys = sim.render_positions()
+            drawn = [(crowd[k], (xs[k], ys[k])) for k in sim.balls.active.nonzero()[0]]
+        else:
+            drawn = [(ball, sim.render_position())]
+        if drawn:
+            camera.follow(drawn[0][1], dt)
+        if track_layer.view(camera.offset):
+            # the view scrolled, so everything on screen moved
+            WIN.blit(track_layer.surface, (0, 0))
+            ball_rects = []
+            overlay_rect = None
+            full_update = True
+        dirty = [back_button.rect]
+        for rect in ball_rects + [overlay_rect]:
+            if rect is not None:
+                track_layer.restore(WIN, rect)
+                dirty.append(rect)
+        ball_rects = [pygame.draw.circle(WIN, each.color, camera.to_screen(pos), each.radius) for each, pos in drawn]
+        dirty += ball_rects
+        overlay_rect = None
+        if show_profiler:
+            overlay_rect = draw_profiler(WIN, DEBUG_FONT, profiler, sim.stats)
+            dirty.append(overlay_rect)
+        profiler.lap('draw')
 
-        WIN.fill(bg_color)
         manager.update(dt)
         manager.draw_ui(WIN)
-        pygame.display.update()
+        profiler.lap('ui')
+        if full_update:
+            pygame.display.update()
+            full_update = False
+        else:
+            pygame.display.update(dirty)
+        profiler.lap('display')
 
-# run sim
-def run_sim(points, ball, back_button):
+    if worker is not None:
+        worker.stop()
+
+    # the main ball carries on from where a stopped run left it, like it does on its own
+    if balls and sim.running and sim.balls.active[0]:
+        ball.x, ball.y = float(sim.balls.x[0]), float(sim.balls.y[0])
+        ball.xvel, ball.yvel = float(sim.balls.xvel[0]), float(sim.balls.yvel[0])
+
+    # counters of every run add up for the edit screen's overlay and export
+    for name, value in sim.stats.items():
+        profiler.count(name, value)
+    
+    return ball, back
+
+# replay of the last run, drawn from its recording instead of simulating it again
+def playback(points, replay, ball, back_button, view=(0, 0)):
     run = True
     back = False
-    vectors = []
-    thicknesses = []
-    
-    points = list(filter(lambda sublist: len(sublist) >= 3, points))
-    new_points = []
-    for sublist in points:
-        thicknesses.append(sublist[0][0])
-        point_list = np.array(sublist[1:])
-        point_list = point_list[np.append(np.any(np.diff(point_list, axis=0) != [0, 0], axis=1), True)]
-        new_points.append(point_list)
-        vectors.append(np.diff(point_list, axis=0))
+    t = replay.start
+    speed = 1
+    paused = False
+
+    camera = Camera((WIDTH, HEIGHT), *view)
+    track_layer = TrackLayer((WIDTH, HEIGHT), bg_color, smooth=SMOOTH)
+    track_layer.redraw(points)
 
     while run:
         dt = clock.tick(FPS)/1000
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                # the screen that started this one quits
+                pygame.event.post(event)
                 run = False
-                pygame.quit()
                 break
 
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                run = False
-                break
-            
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_ESCAPE:
+                    run = False
+                    break
+                elif event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_UP:
+                    speed = min(speed * 2, 64)
+                elif event.key == pygame.K_DOWN:
+                    speed = max(speed / 2, 1/16)
+                elif event.key == pygame.K_LEFT:
+                    t -= 1
+                elif event.key == pygame.K_RIGHT:
+                    t += 1
+                elif event.key == pygame.K_HOME:
+                    t = replay.start
+                elif event.key == pygame.K_END:
+                    t = replay.end
+
             elif event.type == pygame_gui.UI_BUTTON_PRESSED and event.ui_element == back_button:
                 run = False
                 back = True
                 break
-            
-            manager.process_events(event)
 
-        # physics
-        candidates = []
-        center = np.array([ball.x, ball.y])
-        
-        if not ball.freefall:
-            curve_idx, seg_idx = ball.checkpoint
-            start = max(seg_idx - 20, 0)
-            end = min(seg_idx + 21, len(vectors[curve_idx]))
-            vecs = vectors[curve_idx][start: end]
-            projs = center - new_points[curve_idx][start: end]
-
-            scalars = np.einsum('ij, ij -> i', vecs, projs) / np.einsum('ij, ij -> i', vecs, vecs)
-            projections = projs - vecs * scalars[:, np.newaxis]
-            distances = np.linalg.norm(projections, axis=1)
-            on_line = np.sum(projs * vecs, axis=1) / np.sum(vecs * vecs, axis=1)
-            mask = (distances <= ball.radius + thicknesses[curve_idx]/2) & (on_line >= 0) & (on_line <= 1)
-            indices = np.where(mask)[0]
-
-            if len(indices):
-                print('local search successful!')
-                diffs = np.abs(indices + start - seg_idx)
-                ball.checkpoint = np.array([curve_idx, start + np.where(diffs == np.min(diffs))[0][0]])
-                ball.tangent_vector = vectors[ball.checkpoint[0]][ball.checkpoint[1]]
-                projection = projections[ball.checkpoint[1] - start]
-
-                if projection[1] >= 0:
-                    ball.on_top = True
-                else:
-                    ball.on_top = False
-
-                if distances[ball.checkpoint[1] - start] < ball.radius + thicknesses[curve_idx]/2:
-                    tangent_point = center - projection
-                    ball.x, ball.y = tangent_point + projection * (ball.radius + thicknesses[curve_idx]) / np.linalg.norm(projection)
-            else:
-                ball.freefall = True
-
-        if ball.freefall:
-            proj_vectors = [center - sublist[:-1] for sublist in new_points]
-            for i in range(len(vectors)):
-                scalars = np.einsum('ij, ij -> i', vectors[i], proj_vectors[i]) / np.einsum('ij, ij -> i', vectors[i], vectors[i])
-                projections = proj_vectors[i] - vectors[i] * scalars[:, np.newaxis]
-                distances = np.linalg.norm(projections, axis=1)
-                on_line = np.sum(proj_vectors[i] * vectors[i], axis=1) / np.sum(vectors[i] * vectors[i], axis=1)
-                mask = (distances <= ball.radius + thicknesses[i]/2) & (on_line >= 0) & (on_line <= 1)
-
-                indices = np.where(mask)[0]
-                if len(indices):
-                    ball.freefall = False
-                    ball.checkpoint = np.array([i, indices[0]])
-                    ball.tangent_vector = vectors[ball.checkpoint[0]][ball.checkpoint[1]]
-                    projection = projections[ball.checkpoint[1]]
-
-                    if projection[1] >= 0:
-                        ball.on_top = True
-                    else:
-                        ball.on_top = False
-                    
-                    if distances[ball.checkpoint[1]] < ball.radius + thicknesses[i]/2:
-                        tangent_point = center - projection
-                        ball.x, ball.y = tangent_point + projection * (ball.radius + thicknesses[i]) / np.linalg.norm(projection)
-
-                    break
+            manager.process_events(event)
 
-        ball.move(dt)
-
-        if ball.x + ball.radius <= 0 or ball.x - ball.radius >= WIDTH or ball.y + ball.radius <= 0 or ball.y - ball.radius >= HEIGHT:
-            run = False
-            ball.x = 0
-            ball.y = 0
-            ball.xvel = 0
-            ball.yvel = 0
+        if not paused:
+            t += dt * speed
+        t = min(max(t, replay.start), replay.end)
+        state = replay.seek(t)
 
         # draw
-        WIN.fill(bg_color)
-        for sublist in points:
-            pygame.draw.lines(WIN, sublist[0][1], False, sublist[1:], sublist[0][0])
-            
-        pygame.draw.circle(WIN, ball.color, (ball.x, ball.y), ball.radius)
+        camera.follow((state['x'], state['y']), dt)
+        track_layer.view(camera.offset)
+        WIN.blit(track_layer.surface, (0, 0))
+        pygame.draw.circle(WIN, ball.color, camera.to_screen((state['x'], state['y'])), ball.radius)
+        status = f'Replay {t:.2f}s / {replay.end:.2f}s   x{speed:g}' + ('   paused' if paused else '')
+        text = MAIN_FONT.render(status, 1, 'white')
+        WIN.blit(text, (WIDTH - text.get_width() - 20, 20))
 
         manager.update(dt)
         manager.draw_ui(WIN)
         pygame.display.update()
-    
-    return ball, back
 
-# edit sim
-def edit():
-    run = True
-    points = []
-    ball = Ball(20, (0, 0), (0, 0), pygame.Color(255, 255, 255))
-
-    # UI elements
-    coords = pygame_gui.elements.UITextBox(relative_rect=pygame.Rect((20, 730), (75, 60)), object_id='#coords',
-                                         manager=manager, html_text=f'X: {pygame.mouse.get_pos()[0]}<br>Y: {pygame.mouse.get_pos()[1]}')
-    edit_screen = pygame_gui.elements.UIPanel(relative_rect=pygame.Rect(WIDTH - 200, 0, 200, HEIGHT), manager=manager, object_id='#edit_screen')
-    back_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(20, 20, 100, 50),
-                                               text='< Back', manager=manager,
-                                               object_id='#back_button')
-    hide_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(20, 80, 125, 50),
-                                               text='Hide Toolbar', manager=manager,
-                                               object_id="#hide_button")
-    
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 20, 100, 30), text='Tool:',
-                                                  manager=manager, container=edit_screen)
-    tool_select = pygame_gui.elements.UIDropDownMenu(relative_rect=pygame.Rect(20, 50, 150, 50),
-                                                          options_list=['Pencil', 'Eraser'], starting_option='Pencil',
-                                                          manager=manager, container=edit_screen)
+    return back
+
+# edit screen, the track, the ball and every widget are made once and kept between visits
+class EditScreen:
+    def __init__(self):
+        self.points = []
+        self.ball = Ball(settings['ball_radius'], (0, 0), (0, 0), pygame.Color(settings['ball_color']))
+        # more balls placed with the ball tool, they start every run where they were put
+        self.balls = []
+
+        # UI elements
+        self.coords = pygame_gui.elements.UITextBox(relative_rect=pygame.Rect((20, 730), (75, 60)), object_id='#coords',
+                                                  manager=manager, html_text=f'X: {pygame.mouse.get_pos()[0]}<br>Y: {pygame.mouse.get_pos()[1]}')
+        self.edit_screen = pygame_gui.elements.UIPanel(relative_rect=pygame.Rect(WIDTH - 200, 0, 200, HEIGHT), manager=manager, object_id='#edit_screen')
+        self.back_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(20, 20, 100, 50),
+                                                        text='< Back', manager=manager,
+                                                        object_id='#back_button')
+        self.hide_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(20, 80, 125, 50),
+                                                        text='Hide Toolbar', manager=manager,
+                                                        object_id="#hide_button")
     
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 120, 200, 30), text='Tool Size (px):',
-                                manager=manager, container=edit_screen)
-    size_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(20, 150, 100, 40), initial_text='3',
-                                                      manager=manager, container=edit_screen)
-    size_select.set_allowed_characters('numbers')
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 20, 100, 30), text='Tool:',
+                                                      manager=manager, container=self.edit_screen)
+        self.tool_select = pygame_gui.elements.UIDropDownMenu(relative_rect=pygame.Rect(20, 50, 150, 50),
+                                                                   options_list=['Pencil', 'Eraser', 'Ball'], starting_option='Pencil',
+                                                                   manager=manager, container=self.edit_screen)
     
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 210, 150, 30), text='Color:',
-                                manager=manager, container=edit_screen)
-    color_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(100, 210, 30, 30), text='',
-                                 manager=manager, container=edit_screen, object_id='#color_button')
-    color_picker_open = False
-    selected_color = pygame.Color(255, 255, 255)
-    color_select = None
-
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 260, 200, 30), text='Ball Radius (px):',
-                                manager=manager, container=edit_screen)
-    radius_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(20, 290, 100, 40), initial_text='20',
-                                                        manager=manager, container=edit_screen)
-    radius_select.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 120, 200, 30), text='Tool Size (px):',
+                                    manager=manager, container=self.edit_screen)
+        self.size_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(20, 150, 100, 40), initial_text=f"{settings['tool_size']}",
+                                                               manager=manager, container=self.edit_screen)
+        self.size_select.set_allowed_characters('numbers')
     
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 350, 200, 30), text='Ball Color:',
-                                manager=manager, container=edit_screen)
-    ball_color_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(140, 350, 30, 30), text='',
-                                                     manager=manager, container=edit_screen, object_id='#ball_color_button')
-    ball_color = pygame.Color(255, 255, 255)
-    ball_color_select = None
-
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 400, 200, 30), text='Initial Position:',
-                                manager=manager, container=edit_screen)
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 430, 30, 30), text='X:',
-                                manager=manager, container=edit_screen, object_id='#caption')
-    x_pos = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(45, 430, 50, 30), initial_text='0',
-                                                manager=manager, container=edit_screen, object_id='#caption')
-    x_pos.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(110, 430, 30, 30), text='Y:',
-                                manager=manager, container=edit_screen, object_id='#caption')
-    y_pos = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(135, 430, 50, 30), initial_text='0',
-                                                manager=manager, container=edit_screen, object_id='#caption')
-    y_pos.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 210, 150, 30), text='Color:',
+                                    manager=manager, container=self.edit_screen)
+        self.color_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(100, 210, 30, 30), text='',
+                                          manager=manager, container=self.edit_screen, object_id='#color_button')
+        self.selected_color = pygame.Color(settings['line_color'])
+        tint_button(self.color_button, self.selected_color)
+
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 260, 200, 30), text='Ball Radius (px):',
+                                    manager=manager, container=self.edit_screen)
+        self.radius_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(20, 290, 100, 40), initial_text=f"{settings['ball_radius']:g}",
+                                                                 manager=manager, container=self.edit_screen)
+        self.radius_select.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
     
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 480, 200, 30), text='Velocity (px/s):',
-                                manager=manager, container=edit_screen)
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 510, 30, 30), text='X:',
-                                manager=manager, container=edit_screen, object_id='#caption')
-    x_vel = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(45, 510, 50, 30), initial_text='0',
-                                                manager=manager, container=edit_screen, object_id='#caption')
-    x_vel.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '-', '.'])
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(110, 510, 30, 30), text='Y:',
-                                manager=manager, container=edit_screen, object_id='#caption')
-    y_vel = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(135, 510, 50, 30), initial_text='0',
-                                                manager=manager, container=edit_screen, object_id='#caption')
-    y_vel.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '-', '.'])
-
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 560, 200, 30), text='Constants:',
-                                manager=manager, container=edit_screen)
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 590, 75, 30), text='Friction:',
-                                manager=manager, container=edit_screen, object_id='#caption')
-    friction_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(85, 590, 50, 30), initial_text='0',
-                                                          manager=manager, container=edit_screen, object_id='#caption')
-    friction_select.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(140, 590, 60, 30), text='× Fₙ',
-                                manager=manager, container=edit_screen, object_id='#symbol')
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 350, 200, 30), text='Ball Color:',
+                                    manager=manager, container=self.edit_screen)
+        self.ball_color_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(140, 350, 30, 30), text='',
+                                                              manager=manager, container=self.edit_screen, object_id='#ball_color_button')
+        self.ball_color = pygame.Color(settings['ball_color'])
+        tint_button(self.ball_color_button, self.ball_color)
+
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 400, 200, 30), text='Initial Position:',
+                                    manager=manager, container=self.edit_screen)
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 430, 30, 30), text='X:',
+                                    manager=manager, container=self.edit_screen, object_id='#caption')
+        self.x_pos = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(45, 430, 50, 30), initial_text='0',
+                                                         manager=manager, container=self.edit_screen, object_id='#caption')
+        self.x_pos.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '-', '.'])
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(110, 430, 30, 30), text='Y:',
+                                    manager=manager, container=self.edit_screen, object_id='#caption')
+        self.y_pos = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(135, 430, 50, 30), initial_text='0',
+                                                         manager=manager, container=self.edit_screen, object_id='#caption')
+        self.y_pos.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '-', '.'])
     
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 625, 75, 30), text='Gravity:',
-                                manager=manager, container=edit_screen, object_id='#caption')
-    gravity_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(85, 625, 65, 30), initial_text='1000',
-                                                         manager=manager, container=edit_screen, object_id='#caption')
-    gravity_select.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(155, 625, 60, 30), text='px/s²',
-                                manager=manager, container=edit_screen, object_id='#symbol')
-
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 660, 100, 30), text='Air density:',
-                                manager=manager, container=edit_screen, object_id='#caption')
-    density_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(110, 660, 40, 30), initial_text='0',
-                                                         manager=manager, container=edit_screen, object_id='#caption')
-    density_select.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
-    pygame_gui.elements.UILabel(relative_rect=pygame.Rect(152, 660, 60, 30), text='kg/px³',
-                                manager=manager, container=edit_screen, object_id='#symbol')
-
-    validated = True
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 480, 200, 30), text='Velocity (px/s):',
+                                    manager=manager, container=self.edit_screen)
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 510, 30, 30), text='X:',
+                                    manager=manager, container=self.edit_screen, object_id='#caption')
+        self.x_vel = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(45, 510, 50, 30), initial_text='0',
+                                                         manager=manager, container=self.edit_screen, object_id='#caption')
+        self.x_vel.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '-', '.'])
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(110, 510, 30, 30), text='Y:',
+                                    manager=manager, container=self.edit_screen, object_id='#caption')
+        self.y_vel = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(135, 510, 50, 30), initial_text='0',
+                                                         manager=manager, container=self.edit_screen, object_id='#caption')
+        self.y_vel.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '-', '.'])
+
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 560, 200, 30), text='Constants:',
+                                    manager=manager, container=self.edit_screen)
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 590, 75, 30), text='Friction:',
+                                    manager=manager, container=self.edit_screen, object_id='#caption')
+        self.friction_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(85, 590, 50, 30), initial_text=f"{settings['friction']:g}",
+                                                                   manager=manager, container=self.edit_screen, object_id='#caption')
+        self.friction_select.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(140, 590, 60, 30), text='× Fₙ',
+                                    manager=manager, container=self.edit_screen, object_id='#symbol')
     
-    while run:
-        dt = clock.tick(FPS)/1000
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                break
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 625, 75, 30), text='Gravity:',
+                                    manager=manager, container=self.edit_screen, object_id='#caption')
+        self.gravity_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(85, 625, 65, 30), initial_text=f"{settings['gravity']:g}",
+                                                                  manager=manager, container=self.edit_screen, object_id='#caption')
+        self.gravity_select.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(155, 625, 60, 30), text='px/s²',
+                                    manager=manager, container=self.edit_screen, object_id='#symbol')
+
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(20, 660, 100, 30), text='Air density:',
+                                    manager=manager, container=self.edit_screen, object_id='#caption')
+        self.density_select = pygame_gui.elements.UITextEntryLine(relative_rect=pygame.Rect(110, 660, 40, 30), initial_text=f"{settings['air_density']:g}",
+                                                                  manager=manager, container=self.edit_screen, object_id='#caption')
+        self.density_select.set_allowed_characters(['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.'])
+        pygame_gui.elements.UILabel(relative_rect=pygame.Rect(152, 660, 60, 30), text='kg/px³',
+                                    manager=manager, container=self.edit_screen, object_id='#symbol')
+
+        self.validated = True
+
+        # stroke bounding boxes so the eraser only looks at strokes near the cursor
+        self.stroke_index = StrokeIndex(self.points)
+        # grid with the track drawn over it, kept up to date as strokes change
+        self.track_layer = TrackLayer((WIDTH, HEIGHT), GRID)
+        self.track_layer.redraw(self.points, self.stroke_index)
+        # which part of the world is on screen, the arrow keys move it
+        self.camera = Camera((WIDTH, HEIGHT))
+        # the track split into chunks as of the last run, dropped whenever a stroke changes.
+        # the version goes up with every change too, it keys the physics' geometry cache
+        self.world = None
+        self.track_version = 0
+        # recording of the last run, played back with P
+        self.last_replay = None
+
+        self.hide()
+
+    def show(self):
+        for element in (self.coords, self.edit_screen, self.back_button, self.hide_button):
+            element.show()
+        self.hide_button.set_text('Hide Toolbar')
+
+    def hide(self):
+        for element in (self.coords, self.edit_screen, self.back_button, self.hide_button):
+            element.hide()
+
+    # a stroke was added to, erased or loaded, so the last run's chunks are out of date
+    def track_changed(self):
+        self.world = None
+        self.track_version += 1
+
+    # returns the screen to go to next, None to quit
+    def run(self):
+        self.show()
+        run = True
+        next_screen = None
+        color_picker_open = False
+        color_select = None
+        ball_color_select = None
+        # simplifies the pencil stroke being drawn, None when the pencil isn't down
+        stroke = None
+
+        while run:
+            dt = clock.tick(FPS)/1000
+            profiler.frame()
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    run = False
+                    break
             
-            if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN and not(color_picker_open):
-                edit_screen.hide()
-                hide_button.hide()
-                coords.hide()
-
-                ball, back = run_sim(points, ball, back_button)
-                if back:
-                    back_button.hide()
-                    menu()
-                else:
-                    x_pos.set_text(f'{round(ball.x, 1)}')
-                    y_pos.set_text(f'{round(ball.y, 1)}')
-                    x_vel.set_text(f'{round(ball.xvel, 1)}')
-                    y_vel.set_text(f'{round(ball.yvel, 1)}')
-                    edit_screen.show()
-                    hide_button.show()
-                    coords.show()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN and not(color_picker_open):
+                    self.edit_screen.hide()
+                    self.hide_button.hide()
+                    self.coords.hide()
+
+                    if self.world is None:
+                        self.world = ChunkedTrack(self.points, version=self.track_version)
+                    recorder = Recorder()
+                    self.ball, back = run_sim(self.points, self.ball, self.back_button, (self.camera.x, self.camera.y), self.world, recorder, self.balls)
+                    # runs with more than one ball aren't recorded
+                    self.last_replay = recorder.replay() if len(recorder) else None
+                    if back:
+                        next_screen = 'menu'
+                        run = False
+                        break
+                    else:
+                        self.x_pos.set_text(f'{round(self.ball.x, 1)}')
+                        self.y_pos.set_text(f'{round(self.ball.y, 1)}')
+                        self.x_vel.set_text(f'{round(self.ball.xvel, 1)}')
+                        self.y_vel.set_text(f'{round(self.ball.yvel, 1)}')
+                        self.edit_screen.show()
+                        self.hide_button.show()
+                        self.coords.show()
             
-            if event.type == pygame.MOUSEMOTION:
-                coords.set_text(f'X: {pygame.mouse.get_pos()[0]}<br>Y: {pygame.mouse.get_pos()[1]}')
-
-            if event.type == pygame_gui.UI_BUTTON_PRESSED:
-                if event.ui_element == back_button and not(color_picker_open):
-                    edit_screen.hide()
-                    back_button.hide()
-                    hide_button.hide()
-                    coords.hide()
-                    menu()
-
-                elif event.ui_element == hide_button:
-                    if edit_screen.visible:
-                        edit_screen.hide()
-                        hide_button.set_text('Show Toolbar')
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_p and self.last_replay is not None and not(color_picker_open):
+                    self.edit_screen.hide()
+                    self.hide_button.hide()
+                    self.coords.hide()
+
+                    if playback(self.points, self.last_replay, self.ball, self.back_button, (self.camera.x, self.camera.y)):
+                        next_screen = 'menu'
+                        run = False
+                        break
                     else:
-                        edit_screen.show()
-                        hide_button.set_text('Hide Toolbar')
+                        self.edit_screen.show()
+                        self.hide_button.show()
+                        self.coords.show()
+
+                if event.type == pygame.KEYDOWN and event.mod & pygame.KMOD_CTRL and not(color_picker_open):
+                    if event.key == pygame.K_s:
+                        save_track(self.points, TRACK_FILE)
+                    elif event.key == pygame.K_o:
+                        try:
+                            self.points = load_track(TRACK_FILE)
+                            self.stroke_index.rebuild(self.points)
+                            self.track_layer.redraw(self.points, self.stroke_index)
+                            self.track_changed()
+                        # no saved track yet, or one that's damaged or from another format version
+                        except (OSError, ValueError):
+                            pass
+
+                if event.type == pygame.MOUSEMOTION:
+                    mouse_x, mouse_y = self.camera.to_world(pygame.mouse.get_pos())
+                    self.coords.set_text(f'X: {mouse_x}<br>Y: {mouse_y}')
+
+                if event.type == pygame_gui.UI_BUTTON_PRESSED:
+                    if event.ui_element == self.back_button and not(color_picker_open):
+                        next_screen = 'menu'
+                        run = False
+                        break
+
+                    elif event.ui_element == self.hide_button:
+                        if self.edit_screen.visible:
+                            self.edit_screen.hide()
+                            self.hide_button.set_text('Show Toolbar')
+                        else:
+                            self.edit_screen.show()
+                            self.hide_button.set_text('Hide Toolbar')
                 
-                elif event.ui_element == color_button and not(color_picker_open):
-                    color_picker_open = True
-                    color_select = pygame_gui.windows.UIColourPickerDialog(pygame.Rect(200, 200, 500, 500), manager=manager, window_title='Color Picker',
-                                                                           initial_colour=selected_color, object_id='#color_picker')
-                elif event.ui_element == ball_color_button and not(color_picker_open):
-                    color_picker_open = True
-                    ball_color_select = pygame_gui.windows.UIColourPickerDialog(pygame.Rect(200, 200, 500, 500), manager=manager, window_title='Ball Color Picker',
-                                                                                initial_colour=ball_color, object_id='#color_picker')
-                    
-            if event.type == pygame_gui.UI_COLOUR_PICKER_COLOUR_PICKED:
-                if event.ui_element == color_select:
-                    color_picker_open = False
-                    selected_color = event.colour
-                    hex_color = "#{:02x}{:02x}{:02x}".format(selected_color.r, selected_color.g, selected_color.b)
-                    hover_color = hex_color
-                    if selected_color.r >= 20 and selected_color.g >= 20 and selected_color.b >= 20:
-                        hover_color = "#{:02x}{:02x}{:02x}".format(selected_color.r - 20, selected_color.g - 20, selected_color.b - 20)
-
-                    with open('theme.json') as theme:
-                        theme_data = json.load(theme)
-                        theme_data['#color_button']['colors']['normal_bg'] = hex_color
-                        theme_data['#color_button']['colors']['hovered_bg'] = hover_color
+                    elif event.ui_element == self.color_button and not(color_picker_open):
+                        color_picker_open = True
+                        color_select = pygame_gui.windows.UIColourPickerDialog(pygame.Rect(200, 200, 500, 500), manager=manager, window_title='Color Picker',
+                                                                               initial_colour=self.selected_color, object_id='#color_picker')
+                    elif event.ui_element == self.ball_color_button and not(color_picker_open):
+                        color_picker_open = True
+                        ball_color_select = pygame_gui.windows.UIColourPickerDialog(pygame.Rect(200, 200, 500, 500), manager=manager, window_title='Ball Color Picker',
+                                                                                    initial_colour=self.ball_color, object_id='#color_picker')
                     
-                    with open('theme.json', 'w') as theme:
-                        json.dump(theme_data, theme, indent=2)
-
-                elif event.ui_element == ball_color_select:
+                if event.type == pygame_gui.UI_COLOUR_PICKER_COLOUR_PICKED:
+                    if event.ui_element == color_select:
+                        color_picker_open = False
+                        self.selected_color = event.colour
+                        tint_button(self.color_button, self.selected_color)
+                        settings.update(line_color=[self.selected_color.r, self.selected_color.g, self.selected_color.b])
+
+                    elif event.ui_element == ball_color_select:
+                        color_picker_open = False
+                        self.ball_color = event.colour
+                        self.ball.color = self.ball_color
+                        tint_button(self.ball_color_button, self.ball_color)
+                        settings.update(ball_color=[self.ball_color.r, self.ball_color.g, self.ball_color.b])
+
+
+                elif event.type == pygame_gui.UI_WINDOW_CLOSE and event.ui_object_id == '#color_picker':
                     color_picker_open = False
-                    ball_color = event.colour
-                    ball.color = ball_color
-                    hex_color = "#{:02x}{:02x}{:02x}".format(ball_color.r, ball_color.g, ball_color.b)
-                    hover_color = hex_color
-                    if ball_color.r >= 20 and ball_color.g >= 20 and ball_color.b >= 20:
-                        hover_color = "#{:02x}{:02x}{:02x}".format(ball_color.r - 20, ball_color.g - 20, ball_color.b - 20)
-
-                    with open('theme.json') as theme:
-                        theme_data = json.load(theme)
-                        theme_data['#ball_color_button']['colors']['normal_bg'] = hex_color
-                        theme_data['#ball_color_button']['colors']['hovered_bg'] = hover_color
-                    
-                    with open('theme.json', 'w') as theme:
-                        json.dump(theme_data, theme, indent=2)
-
-
-            elif event.type == pygame_gui.UI_WINDOW_CLOSE and event.ui_object_id == '#color_picker':
-                color_picker_open = False
 
-            elif event.type == pygame_gui.UI_TEXT_ENTRY_CHANGED:
-                validated = False
+                elif event.type == pygame_gui.UI_TEXT_ENTRY_CHANGED:
+                    self.validated = False
 
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                if not validated:
-                    validated = True
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    if not self.validated:
+                        self.validated = True
                     
-                    # tool size
-                    if size_select.get_text() == '':
-                        size_select.set_text('3')
+                        # tool size
+                        if self.size_select.get_text() == '':
+                            self.size_select.set_text('3')
                 
-                    size = int(size_select.get_text())
-                    if size < 1 or size > 10:
-                        size = 3
-                        size_select.set_text('3')
+                        size = int(self.size_select.get_text())
+                        if size < 1 or size > 10:
+                            size = 3
+                            self.size_select.set_text('3')
                 
-                    # ball radius
-                    if radius_select.get_text() == '' or list(radius_select.get_text()).count('.') > 1:
-                        radius_select.set_text('20')
+                        # ball radius
+                        if self.radius_select.get_text() == '' or list(self.radius_select.get_text()).count('.') > 1:
+                            self.radius_select.set_text('20')
                     
-                    radius = float(radius_select.get_text())
-                    if radius < 10 or radius > 75:
-                        radius = 20
-                        radius_select.set_text('20')
-                    ball.radius = radius
-
-                    # initial position
-                    if x_pos.get_text() == '' or list(x_pos.get_text()).count('.') > 1:
-                        x_pos.set_text('0')
+                        radius = float(self.radius_select.get_text())
+                        if radius < 10 or radius > 75:
+                            radius = 20
+                            self.radius_select.set_text('20')
+                        self.ball.radius = radius
+
+                        # initial position
+                        # the world scrolls, so any position is fine
+                        if self.x_pos.get_text() == '' or list(self.x_pos.get_text()).count('.') > 1 or list(self.x_pos.get_text()).count('-') > 1:
+                            self.x_pos.set_text('0')
+                        self.ball.x = float(self.x_pos.get_text())
+
+                        if self.y_pos.get_text() == '' or list(self.y_pos.get_text()).count('.') > 1 or list(self.y_pos.get_text()).count('-') > 1:
+                            self.y_pos.set_text('0')
+                        self.ball.y = float(self.y_pos.get_text())
+
+                        # initial velocity
+                        if self.x_vel.get_text() == '' or list(self.x_vel.get_text()).count('.') > 1 or list(self.x_vel.get_text()).count('-') > 1:
+                            self.x_vel.set_text('0')
                     
-                    X = float(x_pos.get_text())
-                    if X < 0 or X > WIDTH:
-                        X = 0
-                        x_pos.set_text('0')
-                    ball.x = X
-
-                    if y_pos.get_text() == '' or list(y_pos.get_text()).count('.') > 1:
-                        y_pos.set_text('0')
-
-                    Y = float(y_pos.get_text())
-                    if Y < 0 or Y > HEIGHT:
-                        Y = 0
-                        y_pos.set_text('0')
-                    ball.y = Y
-
-                    # initial velocity
-                    if x_vel.get_text() == '' or list(x_vel.get_text()).count('.') > 1 or list(x_vel.get_text()).count('-') > 1:
-                        x_vel.set_text('0')
+                        XVEL = float(self.x_vel.get_text())
+                        if XVEL < -500 or XVEL > 500:
+                            XVEL = 0
+                            self.x_vel.set_text('0')
+                        self.ball.xvel = XVEL
+
+                        if self.y_vel.get_text() == '' or list(self.y_vel.get_text()).count('.') > 1 or list(self.y_vel.get_text()).count('-') > 1:
+                            self.y_vel.set_text('0')
+
+                        YVEL = float(self.y_vel.get_text())
+                        if YVEL < -500 or YVEL > 500:
+                            YVEL = 0
+                            self.y_vel.set_text('0')
+                        self.ball.yvel = YVEL
+
+                        # friction
+                        if self.friction_select.get_text() == '' or list(self.friction_select.get_text()).count('.') > 1:
+                            self.friction_select.set_text('0')
                     
-                    XVEL = float(x_vel.get_text())
-                    if XVEL < -500 or XVEL > 500:
-                        XVEL = 0
-                        x_vel.set_text('0')
-                    ball.xvel = XVEL
-
-                    if y_vel.get_text() == '' or list(y_vel.get_text()).count('.') > 1 or list(y_vel.get_text()).count('-') > 1:
-                        y_vel.set_text('0')
-
-                    YVEL = float(y_vel.get_text())
-                    if YVEL < -500 or YVEL > 500:
-                        YVEL = 0
-                        y_vel.set_text('0')
-                    ball.yvel = YVEL
-
-                    # friction
-                    if friction_select.get_text() == '' or list(friction_select.get_text()).count('.') > 1:
-                        friction_select.set_text('0')
-                    
-                    global friction
-                    friction = float(friction_select.get_text())
-
-                    # gravity
-                    if gravity_select.get_text() == '' or list(gravity_select.get_text()).count('.') > 1:
-                        gravity_select.set_text('1000')
-                    
-                    GRAV = float(gravity_select.get_text())
-                    if GRAV > 1500:
-                        GRAV = 1000
-                        gravity_select.set_text('1000')
-                    global g
-                    g = GRAV
-
-                    # air density
-                    if density_select.get_text() == '' or list(density_select.get_text()).count('.') > 1:
-                        density_select.set_text('0')
-                    
-                    global rho
-                    rho = float(density_select.get_text())
-
-                if tool_select.selected_option[0] == 'Pencil':
-                    points.append([[int(size_select.get_text()), pygame.Color(selected_color.r, selected_color.g, selected_color.b)]])
-
-            manager.process_events(event)
+                        global friction
+                        friction = float(self.friction_select.get_text())
 
-        # draw
-        WIN.blit(GRID)
-        pygame.draw.circle(WIN, ball.color, (ball.x, ball.y), ball.radius)
-
-        if ((pygame.mouse.get_pressed()[0] and edit_screen.visible == False) or (pygame.mouse.get_pressed()[0] and pygame.mouse.get_pos()[0] < 800)) and not(color_picker_open):
-            if tool_select.selected_option[0] == 'Pencil':
-                points[-1].append(pygame.mouse.get_pos())
-
-            elif tool_select.selected_option[0] == 'Eraser':
-                new_points = []
-                for sublist in points:
-                    if len(sublist) <= 1:
-                        continue
-
-                    splice_points = []
-                    radius = int(size_select.get_text()) * 5
-                    point_list = np.array(sublist[1:])
-                    is_in_range = np.linalg.norm(point_list - pygame.mouse.get_pos(), axis=1) <= radius
-                    diffs = np.diff(is_in_range.astype(int))
-
-                    if not(is_in_range[0]):
-                        splice_points.append([0])
-
-                    for i in range(len(diffs)):
-                        if diffs[i] == 1:
-                            splice_points[-1].append(i+1)
-                        elif diffs[i] == -1:
-                            splice_points.append([i+1])
+                        # gravity
+                        if self.gravity_select.get_text() == '' or list(self.gravity_select.get_text()).count('.') > 1:
+                            self.gravity_select.set_text('1000')
                     
-                    if not(is_in_range[-1]):
-                        splice_points[-1].append(len(point_list))
+                        GRAV = float(self.gravity_select.get_text())
+                        if GRAV > 1500:
+                            GRAV = 1000
+                            self.gravity_select.set_text('1000')
+                        global g
+                        g = GRAV
+
+                        # air density
+                        if self.density_select.get_text() == '' or list(self.density_select.get_text()).count('.') > 1:
+                            self.density_select.set_text('0')
                     
-                    for splice in splice_points:
-                        new_sublist = list(point_list[splice[0]:splice[1]])
-                        new_sublist.insert(0, sublist[0])
-                        new_points.append(new_sublist)
-
-                points = new_points
-  
-        for sublist in points:
-            if len(sublist) >= 3:
-                pygame.draw.lines(WIN, sublist[0][1], False, sublist[1:], sublist[0][0])
-
-        manager.update(dt)
-        manager.draw_ui(WIN)
-        pygame.display.update()
-    
-    pygame.quit()
+                        global rho
+                        rho = float(self.density_select.get_text())
 
-# menu screen
-def menu():
-    run = True
-    
-    menu_screen = pygame_gui.elements.UIPanel(relative_rect=pygame.Rect(0, 0, WIDTH, HEIGHT), manager=manager)
+                        settings.update(tool_size=size, ball_radius=radius, friction=friction, gravity=g, air_density=rho)
 
-    # buttons
-    button_width, button_height = 200, 75
-    start_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect((WIDTH - button_width)/2, 300, button_width, button_height),
-                                                text='Start', manager=manager, container=menu_screen)
-    help_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect((WIDTH - button_width)/2, 400, button_width, button_height),
-                                               text='Help', manager=manager, container=menu_screen)
+                    if self.tool_select.selected_option[0] == 'Pencil':
+                        self.points.append([[int(self.size_select.get_text()), pygame.Color(self.selected_color.r, self.selected_color.g, self.selected_color.b)]])
+                        self.stroke_index.add_stroke()
+                        stroke = StrokeBuilder()
 
-    while run:
-        dt = clock.tick(FPS)/1000
+                    # a copy of the main ball, dropped where the canvas was clicked
+                    elif (self.tool_select.selected_option[0] == 'Ball' and event.button == 1 and not(color_picker_open)
+                          and (not self.edit_screen.visible or event.pos[0] < 800) and not manager.get_hovering_any_element()):
+                        self.balls.append(Ball(self.ball.radius, self.camera.to_world(event.pos), (self.ball.xvel, self.ball.yvel), self.ball.color))
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
+                profiler_keys(event)
+                manager.process_events(event)
+            if not run:
                 break
+            profiler.lap('events')
+
+            # arrow keys scroll the view, unless they're moving the cursor in a text box
+            if not any(isinstance(element, pygame_gui.elements.UITextEntryLine) for element in manager.get_focus_set() or ()):
+                keys = pygame.key.get_pressed()
+                self.camera.x += (keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]) * PAN_SPEED * dt
+                self.camera.y += (keys[pygame.K_DOWN] - keys[pygame.K_UP]) * PAN_SPEED * dt
+            self.track_layer.view(self.camera.offset)
+            mouse_pos = self.camera.to_world(pygame.mouse.get_pos())
+
+            if ((pygame.mouse.get_pressed()[0] and self.edit_screen.visible == False) or (pygame.mouse.get_pressed()[0] and pygame.mouse.get_pos()[0] < 800)) and not(color_picker_open):
+                if self.tool_select.selected_option[0] == 'Pencil' and stroke is not None:
+                    for point in stroke.add(mouse_pos):
+                        self.points[-1].append(point)
+                        self.stroke_index.add_point(len(self.points) - 1, point)
+                        self.track_layer.extend(self.points[-1])
+                        self.track_changed()
+
+                elif self.tool_select.selected_option[0] == 'Eraser':
+                    radius = int(self.size_select.get_text()) * 5
+                    if erase(self.points, self.stroke_index, mouse_pos, radius):
+                        self.track_layer.redraw(self.points, self.stroke_index)
+                        self.track_changed()
+                    # placed balls the eraser touches go too
+                    self.balls = [other for other in self.balls
+                                  if (other.x - mouse_pos[0]) ** 2 + (other.y - mouse_pos[1]) ** 2 > (radius + other.radius) ** 2]
+
+            # the pencil was let go, the end of the stroke is final now
+            if stroke is not None and (not pygame.mouse.get_pressed()[0] or self.tool_select.selected_option[0] != 'Pencil'):
+                for point in stroke.finish():
+                    self.points[-1].append(point)
+                    self.stroke_index.add_point(len(self.points) - 1, point)
+                    self.track_layer.extend(self.points[-1])
+                    self.track_changed()
+                stroke = None
+            profiler.lap('tools')
+
+            # draw
+            WIN.blit(self.track_layer.surface, (0, 0))
+            # the part of the stroke still being simplified, straight to where the cursor is
+            if stroke is not None and len(self.points[-1]) >= 2 and stroke.last != self.points[-1][-1]:
+                pygame.draw.line(WIN, self.points[-1][0][1], self.camera.to_screen(self.points[-1][-1]), self.camera.to_screen(stroke.last), self.points[-1][0][0])
+            for each in [self.ball] + self.balls:
+                pygame.draw.circle(WIN, each.color, self.camera.to_screen((each.x, each.y)), each.radius)
+            if show_profiler:
+                draw_profiler(WIN, DEBUG_FONT, profiler)
+            profiler.lap('draw')
+
+            manager.update(dt)
+            manager.draw_ui(WIN)
+            profiler.lap('ui')
+            pygame.display.update()
+            profiler.lap('display')
+
+        self.hide()
+        return next_screen
 
-            if event.type == pygame_gui.UI_BUTTON_PRESSED:
-                menu_screen.hide()
-
-                if event.ui_element == help_button:
-                    help(menu_screen)
 
-                if event.ui_element == start_button:
-                    edit()
-        
-            manager.process_events(event)
-        
-        # drawing
-        WIN.fill(bg_color)
-        title = TITLE_FONT.render('Physics Sandbox', 1, 'white')
-        WIN.blit(title, ((WIDTH - title.get_width())/2, 50))
-
-        manager.update(dt)
-        manager.draw_ui(WIN)
-        pygame.display.update()
+# menu screen
+class MenuScreen:
+    def __init__(self):
+        self.menu_screen = pygame_gui.elements.UIPanel(relative_rect=pygame.Rect(0, 0, WIDTH, HEIGHT), manager=manager)
+
+        # buttons
+        button_width, button_height = 200, 75
+        self.start_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect((WIDTH - button_width)/2, 300, button_width, button_height),
+                                                         text='Start', manager=manager, container=self.menu_screen)
+        self.help_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect((WIDTH - button_width)/2, 400, button_width, button_height),
+                                                        text='Help', manager=manager, container=self.menu_screen)
+        self.menu_screen.hide()
+
+    def run(self):
+        self.menu_screen.show()
+        run = True
+        next_screen = None
+
+        while run:
+            dt = clock.tick(FPS)/1000
+
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    run = False
+                    break
 
+                if event.type == pygame_gui.UI_BUTTON_PRESSED:
+                    if event.ui_element == self.help_button:
+                        next_screen = 'help'
+                        run = False
+                        break
+
+                    if event.ui_element == self.start_button:
+                        next_screen = 'edit'
+                        run = False
+                        break
+
+                manager.process_events(event)
+
+            # drawing
+            WIN.fill(bg_color)
+            title = TITLE_FONT.render('Physics Sandbox', 1, 'white')
+            WIN.blit(title, ((WIDTH - title.get_width())/2, 50))
+
+            manager.update(dt)
+            manager.draw_ui(WIN)
+            pygame.display.update()
+
+        self.menu_screen.hide()
+        return next_screen
+
+# every screen is made once up front, then the screens hand over to each other by name
+# instead of calling each other, so moving between them never adds widgets or stack frames
+def main():
+    screens = {'menu': MenuScreen(), 'help': HelpScreen(), 'edit': EditScreen()}
+    screen = 'menu'
+    while screen is not None:
+        screen = screens[screen].run()
     pygame.quit()
-    
-menu()
\ No newline at end of file
+
+main()
\ No newline at end of file
@@ -0,0 +1,598 @@
+import hashlib
+import math
+from collections import OrderedDict
+
+import numpy as np
+from collision import CONTACT_SLOP, SegmentGrid, time_of_impact
+from track import Track
+from profiler import NULL_PROFILER
+from spline import SplineTrack
+from world import ChunkedTrack
+
+# default sim constants, the edit screen overrides these per run
+G = 1000
+FRICTION = 0
+RHO = 0
+
+# drag on the ball is rho * DRAG_COEFFICIENT * area * v² / 2, and it weighs BALL_DENSITY
+# kg per px³, so a bigger ball slows down less in the same air
+DRAG_COEFFICIENT = 0.47
+BALL_DENSITY = 1
+
+# fixed physics step and the most steps one frame may take
+TIMESTEP = 1/240
+MAX_SUBSTEPS = 16
+
+# most segments either side a single rolling ball's contact tracker will look at
+MAX_TRACK_WINDOW = 256
+# local search windows up to this many segments are tested in plain python floats
+SCALAR_WINDOW = 48
+
+# drag acceleration per speed², for a sphere it's 3 rho Cd / (8 density radius)
+def drag_factor(rho, radius):
+    return 3 * rho * DRAG_COEFFICIENT / (8 * BALL_DENSITY * radius)
+
+# plain float state of one ball, slotted so attribute access stays cheap in the step loop.
+# checkpoint is (curve, segment) and tangent_vector a unit (x, y) while in contact, on_top
+# is whether the ball is above the track rather than under it and curvature how sharply
+# the track bends towards the ball there, negative where it bends away
+class Ball:
+    __slots__ = ('radius', 'x', 'y', 'xvel', 'yvel', 'color', 'freefall', 'checkpoint', 'tangent_vector', 'on_top',
+                 'curvature')
+
+    def __init__(self, radius, pos, vel, color):
+        self.radius = radius
+        self.x, self.y = pos
+        self.xvel, self.yvel = vel
+        self.color = color
+        self.freefall = True
+        self.checkpoint = None
+        self.tangent_vector = None
+        self.on_top = None
+        self.curvature = 0.0
+
+    # acceleration for a given velocity from gravity, quadratic drag and, when in contact,
+    # coulomb friction against the normal force, all of it along the track in contact.
+    # drag is the factor from drag_factor(), dt the step it's integrated over, everything
+    # is plain floats
+    def acceleration(self, xvel, yvel, g=G, friction=FRICTION, drag=0, dt=TIMESTEP):
+        if self.freefall:
+            speed = math.hypot(xvel, yvel)
+            return -drag * speed * xvel, g - drag * speed * yvel
+
+        tx, ty = self.tangent_vector
+        along = tx * xvel + ty * yvel
+        pull = ty * g - drag * abs(along) * along
+        if not friction:
+            return tx * pull, ty * pull
+
+        # gravity presses a ball on top into the track and pulls one underneath away from
+        # it, and a track bending towards the ball pushes on it harder the faster it goes.
+        # the track can only push, so the load never goes below zero
+        load = g * abs(tx) if self.on_top else -g * abs(tx)
+        load += along * along * self.curvature
+        grip = friction * load if load > 0 else 0.0
+
+        # friction takes out as much as would leave the ball at rest by the end of the step,
+        # up to the grip. a moving ball gets the full grip against its motion, one at rest
+        # stays put while the grip can hold it, and one about to stop stops instead of being
+        # pushed back the other way, whichever velocity an integrator evaluates it at
+        hold = -(along / dt + pull)
+        pull += min(max(hold, -grip), grip)
+        return tx * pull, ty * pull
+
+    def move(self, dt, g=G, integrator='euler', friction=FRICTION, rho=RHO):
+        drag = drag_factor(rho, self.radius) if rho else 0
+
+        if self.freefall:
+            INTEGRATORS[integrator](self, dt, g, friction, drag)
+            return
+
+        tx, ty = self.tangent_vector
+        along = tx * self.xvel + ty * self.yvel
+        self.xvel, self.yvel = tx * along, ty * along
+
+        INTEGRATORS[integrator](self, dt, g, friction, drag)
+
+        # friction only ever slows the ball down, if the step took it through zero and
+        # static friction can hold it there, it stops instead of wobbling back and forth.
+        # a ball at rest under the track has no load for it to hold with
+        if friction and self.on_top and (tx * self.xvel + ty * self.yvel) * along < 0 and abs(ty) <= friction * abs(tx):
+            self.xvel = self.yvel = 0.0
+
+
+# semi-implicit euler, velocity first then position with the new velocity
+def euler(ball, dt, g, friction=FRICTION, drag=0):
+    ax, ay = ball.acceleration(ball.xvel, ball.yvel, g, friction, drag, dt)
+    ball.xvel += ax * dt
+    ball.yvel += ay * dt
+    ball.x += ball.xvel * dt
+    ball.y += ball.yvel * dt
+
+# velocity verlet
+def verlet(ball, dt, g, friction=FRICTION, drag=0):
+    ax, ay = ball.acceleration(ball.xvel, ball.yvel, g, friction, drag, dt)
+    ball.x += ball.xvel * dt + ax * dt * dt / 2
+    ball.y += ball.yvel * dt + ay * dt * dt / 2
+    nx, ny = ball.acceleration(ball.xvel + ax * dt, ball.yvel + ay * dt, g, friction, drag, dt)
+    ball.xvel += (ax + nx) * dt / 2
+    ball.yvel += (ay + ny) * dt / 2
+
+# classic fourth order runge-kutta on (position, velocity)
+def rk4(ball, dt, g, friction=FRICTION, drag=0):
+    vx1, vy1 = ball.xvel, ball.yvel
+    ax1, ay1 = ball.acceleration(vx1, vy1, g, friction, drag, dt)
+    vx2, vy2 = vx1 + ax1 * dt / 2, vy1 + ay1 * dt / 2
+    ax2, ay2 = ball.acceleration(vx2, vy2, g, friction, drag, dt)
+    vx3, vy3 = vx1 + ax2 * dt / 2, vy1 + ay2 * dt / 2
+    ax3, ay3 = ball.acceleration(vx3, vy3, g, friction, drag, dt)
+    vx4, vy4 = vx1 + ax3 * dt, vy1 + ay3 * dt
+    ax4, ay4 = ball.acceleration(vx4, vy4, g, friction, drag, dt)
+
+    ball.x += (vx1 + 2*vx2 + 2*vx3 + vx4) * dt / 6
+    ball.y += (vy1 + 2*vy2 + 2*vy3 + vy4) * dt / 6
+    ball.xvel += (ax1 + 2*ax2 + 2*ax3 + ax4) * dt / 6
+    ball.yvel += (ay1 + 2*ay2 + 2*ay3 + ay4) * dt / 6
+
+INTEGRATORS = {'euler': euler, 'verlet': verlet, 'rk4': rk4}
+
+
+# whether the move from p0 to p1 took a point through the segment from (sx, sy) along
+# (vx, vy), from one side to the other somewhere within its span
+def _crossed(p0, p1, sx, sy, vx, vy):
+    before = vx * (p0[1] - sy) - vy * (p0[0] - sx)
+    after = vx * (p1[1] - sy) - vy * (p1[0] - sx)
+    if before * after >= 0:
+        return False
+    t = before / (before - after)
+    x, y = p0[0] + (p1[0] - p0[0]) * t - sx, p0[1] + (p1[1] - p0[1]) * t - sy
+    return 0 <= vx * x + vy * y <= vx * vx + vy * vy
+
+
+# track arrays the collision code works on, from the point lists edit() builds or a Track
+def build_track(points):
+    if isinstance(points, Track):
+        return _build_from_arrays(points)
+
+    vectors = []
+    thicknesses = []
+
+    points = list(filter(lambda sublist: len(sublist) >= 3, points))
+    new_points = []
+    for sublist in points:
+        thicknesses.append(sublist[0][0])
+        point_list = np.array(sublist[1:])
+        point_list = point_list[np.append(np.any(np.diff(point_list, axis=0) != [0, 0], axis=1), True)]
+        new_points.append(point_list)
+        vectors.append(np.diff(point_list, axis=0))
+
+    return points, new_points, vectors, thicknesses
+
+# the same, straight from a Track's flat arrays without going through python lists
+def _build_from_arrays(track):
+    lengths = np.diff(track.offsets)
+    strokes = np.flatnonzero(lengths >= 2)
+    xy = np.asarray(track.points, dtype=float)
+
+    # drop points equal to the next point of the same stroke, the last point always stays
+    keep = np.ones(len(xy), dtype=bool)
+    if len(xy):
+        last = np.zeros(len(xy), dtype=bool)
+        last[track.offsets[1:][lengths > 0] - 1] = True
+        keep[:-1] = np.any(xy[1:] != xy[:-1], axis=1) | last[:-1]
+
+    kept = np.add.reduceat(keep, track.offsets[:-1]) if len(xy) else np.zeros(len(track), dtype=int)
+    kept[lengths == 0] = 0
+    new_points = np.split(xy[keep], np.cumsum(kept)[:-1])
+    new_points = [new_points[i] for i in strokes]
+    vectors = [np.diff(point_list, axis=0) for point_list in new_points]
+    thicknesses = track.thickness[strokes].astype(float).tolist()
+    return track, new_points, vectors, thicknesses
+
+
+# everything the physics needs from one track: per curve points and segment vectors,
+# plus the grid with segment lengths, tangents, normals and bounding boxes
+class TrackGeometry:
+    def __init__(self, points):
+        _, self.new_points, self.vectors, self.thicknesses = build_track(points)
+        self.grid = SegmentGrid(self.new_points, self.vectors, self.thicknesses)
+        self._spline = None
+
+    # the curves fitted through the same points, only built once a smooth run asks for it
+    @property
+    def spline(self):
+        if self._spline is None:
+            self._spline = SplineTrack(self.new_points)
+        return self._spline
+
+# tracks whose geometry is kept around, most recently used last
+GEOMETRY_CACHE_SIZE = 8
+_geometry_cache = OrderedDict()
+
+# hash of the parts of a track the physics depends on, colors don't count
+def track_key(track):
+    digest = hashlib.blake2b(digest_size=16)
+    for array in (track.offsets, track.points, track.thickness):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+# geometry for a track or point list, only built the first time that content is seen.
+# version is anything hashable that changes whenever the track does, like the edit
+# screen's stroke version. given one, a cache hit is a dict lookup instead of converting
+# and hashing the whole track
+def track_geometry(points, version=None):
+    track = None
+    if version is not None:
+        key = ('version', version)
+    else:
+        track = points if isinstance(points, Track) else Track.from_points(points)
+        key = track_key(track)
+
+    geometry = _geometry_cache.get(key)
+    if geometry is None:
+        if track is None:
+            track = points if isinstance(points, Track) else Track.from_points(points)
+        geometry = _geometry_cache[key] = TrackGeometry(track)
+        if len(_geometry_cache) > GEOMETRY_CACHE_SIZE:
+            _geometry_cache.popitem(last=False)
+    else:
+        _geometry_cache.move_to_end(key)
+    return geometry
+
+
+# display free simulation of one ball on a track, stepped as fast as the caller likes.
+# the track can be a point list, a Track, an already built TrackGeometry or a ChunkedTrack
+# that's streamed in around the ball. with smooth the ball rolls on splines fitted through
+# each stroke's points instead of the straight segments between them. bounds is
+# (width, height) from the origin or (left, top, right, bottom)
+class Simulation:
+    def __init__(self, points, ball, g=G, friction=FRICTION, rho=RHO, bounds=None,
+                 timestep=TIMESTEP, max_substeps=MAX_SUBSTEPS, integrator='euler', continuous=True, recorder=None,
+                 profiler=None, smooth=False):
+        if integrator not in INTEGRATORS:
+            raise ValueError(f'unknown integrator {integrator!r}, expected one of {list(INTEGRATORS)}')
+
+        self.ball = ball
+        self.g = g
+        self.friction = friction
+        self.rho = rho
+        self.bounds = bounds
+        self.timestep = timestep
+        self.max_substeps = max_substeps
+        self.integrator = integrator
+        self.continuous = continuous
+        self.time = 0
+        self.steps = 0
+        self.running = True
+
+        # fixed timestep state, leftover frame time and the position before the last step
+        self.accumulator = 0
+        self.alpha = 0
+        self.prev_x, self.prev_y = ball.x, ball.y
+        # where the ball's last move started, after any push out of a line
+        self._moved_from = (ball.x, ball.y)
+
+        self.smooth = smooth
+
+        # how contact was found while rolling: on the same curve, by moving to another
+        # curve, or not at all so the ball went back to the freefall broadphase, how
+        # many segments all the contact tests looked at and how often chunks were streamed in
+        self.stats = {'local_hits': 0, 'transitions': 0, 'fallbacks': 0, 'segments_tested': 0, 'chunk_loads': 0}
+
+        # a ChunkedTrack only has the chunks around the ball loaded, origins holds the
+        # (stroke, first segment) each loaded curve was cut from
+        self.world = points if isinstance(points, ChunkedTrack) else None
+        self.origins = None
+        self._chunk = None
+        if self.world is not None:
+            self._stream()
+        else:
+            # the track is static for the whole run, so its geometry (and the broadphase
+            # grid for freefall contact) is shared with any other run on the same track
+            self._use_geometry(points if isinstance(points, TrackGeometry) else track_geometry(points))
+
+        # optional profiler.Profiler timing each phase of a step
+        self.profiler = profiler or NULL_PROFILER
+
+        # the ball's center as an array for the contact math, refilled every step
+        self._center = np.zeros(2)
+
+        # optional replay.Recorder that gets the ball state after every step
+        self.recorder = recorder
+        if recorder is not None:
+            recorder.record(self.time, ball)
+
+    def _use_geometry(self, geometry):
+        self.geometry = geometry
+        self.grid = geometry.grid
+        self.thicknesses = geometry.thicknesses
+        self.spline = geometry.spline if self.smooth else None
+
+        # how far from a segment's center line a ball's edge counts as touching it. smooth
+        # runs widen it by how far the spline bows out, then check the spline itself
+        self._rows = self.grid.rows
+        if self.smooth:
+            self._rows = self._rows.copy()
+            self._rows[:, 5] += self.spline.bulge
+        self._half = self._rows[:, 5]
+        self._pad = float(self.spline.bulge.max(initial=0)) if self.smooth else 0
+
+    # loads the chunks around the ball once it's moved into another chunk, moving a rolling
+    # ball's contact over to the same segment in the newly cut curves
+    def _stream(self):
+        ball, world = self.ball, self.world
+        chunk = world.chunk_of(ball.x, ball.y)
+        if chunk == self._chunk:
+            return
+
+        track, origins = world.extract(world.block(ball.x, ball.y))
+        old_origins = self.origins
+        self._chunk = chunk
+        self._use_geometry(track_geometry(track, None if world.version is None else (world.version, chunk)))
+        self.origins = origins
+        self.stats['chunk_loads'] += 1
+
+        if ball.freefall or old_origins is None:
+            return
+        curve, seg = ball.checkpoint
+        stroke, seg = old_origins[curve, 0], old_origins[curve, 1] + seg
+        offsets = self.grid.offsets
+        for new in np.flatnonzero((origins[:, 0] == stroke) & (origins[:, 1] <= seg)):
+            if seg - origins[new, 1] < offsets[new + 1] - offsets[new]:
+                ball.checkpoint = (int(new), int(seg - origins[new, 1]))
+                return
+        ball.freefall = True
+
+    # consumes frame time in fixed steps, at most max_substeps of them per call so a
+    # hitch slows the sim down rather than making it take one huge step
+    def advance(self, frame_dt):
+        self.accumulator += frame_dt
+        substeps = 0
+        while self.running and self.accumulator >= self.timestep and substeps < self.max_substeps:
+            self.step(self.timestep)
+            self.accumulator -= self.timestep
+            substeps += 1
+
+        if substeps == self.max_substeps:
+            self.accumulator = min(self.accumulator, self.timestep)
+        self.alpha = self.accumulator / self.timestep
+        return self.running
+
+    # ball position blended between the last two steps for drawing
+    def render_position(self):
+        ball = self.ball
+        return (self.prev_x + (ball.x - self.prev_x) * self.alpha,
+                self.prev_y + (ball.y - self.prev_y) * self.alpha)
+
+    def step(self, dt):
+        ball = self.ball
+        self.prev_x, self.prev_y = ball.x, ball.y
+        center = self._center
+        center[0], center[1] = ball.x, ball.y
+
+        profiler = self.profiler
+
+        if self.world is not None:
+            with profiler.phase('stream'):
+                self._stream()
+
+        if not ball.freefall:
+            with profiler.phase('local_search'):
+                self._local_search(center, dt, self._moved_from)
+
+        if ball.freefall:
+            with profiler.phase('broadphase'):
+                self._broadphase(center, dt)
+
+        self._moved_from = (ball.x, ball.y)
+        with profiler.phase('move'):
+            ball.move(dt, self.g, self.integrator, self.friction, self.rho)
+
+        # stop a falling ball where it first touches a line instead of letting it
+        # jump past thin lines on big steps
+        if ball.freefall and self.continuous:
+            with profiler.phase('sweep'):
+                self._sweep(center)
+
+        self.time += dt
+        self.steps += 1
+
+        if self.bounds is not None:
+            left, top, right, bottom = self.bounds if len(self.bounds) == 4 else (0, 0, *self.bounds)
+            if ball.x + ball.radius <= left or ball.x - ball.radius >= right or ball.y + ball.radius <= top or ball.y - ball.radius >= bottom:
+                self.running = False
+
+        if self.recorder is not None:
+            self.recorder.record(self.time, ball)
+
+        return self.running
+
+    # steps until the ball leaves the bounds or max_steps is hit, returns the steps taken
+    def run(self, dt, max_steps):
+        start = self.steps
+        while self.running and self.steps - start < max_steps:
+            self.step(dt)
+        return self.steps - start
+
+    def _sweep(self, start):
+        ball, grid = self.ball, self.grid
+        end = (ball.x, ball.y)
+        candidates = grid.query(start, end, ball.radius)
+        t, hit = time_of_impact(start, end, ball.radius, grid.starts[candidates], grid.vectors[candidates],
+                                grid.thickness[candidates], grid.normals[candidates], grid.lengths_sq[candidates])
+        if hit is not None:
+            ball.x = start[0] + (ball.x - start[0]) * t
+            ball.y = start[1] + (ball.y - start[1]) * t
+
+    # point in time contact test of the ball against some of the grid's segments,
+    # given as a slice or an index array into the flat arrays
+    def _contact_test(self, center, segs):
+        ball, grid = self.ball, self.grid
+        vecs = grid.vectors[segs]
+        projs = center - grid.starts[segs]
+
+        scalars = np.einsum('ij, ij -> i', vecs, projs) / grid.lengths_sq[segs]
+        projections = projs - vecs * scalars[:, np.newaxis]
+        distances = np.sqrt(np.einsum('ij, ij -> i', projections, projections))
+        mask = (distances <= ball.radius + self._half[segs]) & (scalars >= 0) & (scalars <= 1)
+        self.stats['segments_tested'] += len(mask)
+        return mask, projections, distances
+
+    # the same test in plain floats for the few segments of a local search window or near
+    # it, where numpy's per call overhead costs more than the math. segs is a slice or an
+    # index array, returns the hit the ball has sunk deepest into as (flat index,
+    # projection, distance), or None
+    def _scalar_contact(self, center, segs):
+        radius = self.ball.radius
+        cx, cy = float(center[0]), float(center[1])
+        best = None
+        best_depth = math.inf
+
+        flats = range(segs.start, segs.stop) if isinstance(segs, slice) else segs.tolist()
+        for flat, (sx, sy, vx, vy, length_sq, half) in zip(flats, self._rows[segs].tolist()):
+            px, py = cx - sx, cy - sy
+            scalar = (vx * px + vy * py) / length_sq
+            if scalar < 0 or scalar > 1:
+                continue
+            px -= vx * scalar
+            py -= vy * scalar
+            distance = math.sqrt(px * px + py * py)
+            if distance <= radius + half and distance - half < best_depth:
+                best = (flat, (px, py), distance)
+                best_depth = distance - half
+
+        self.stats['segments_tested'] += len(flats)
+        return best
+
+    # puts the ball in contact with a segment, pushing it out of the line if it sank in.
+    # given where the ball's last move started, a ball whose center went right through the
+    # segment on that move is put back out on the side it came from. returns whether it
+    # touched, which only fails when the spline bows away from the ball
+    def _touch(self, center, flat, projection, distance, before=None):
+        ball, grid = self.ball, self.grid
+        i = int(grid.curve[flat])
+        reach = ball.radius + self.thicknesses[i]/2
+        px, py = float(projection[0]), float(projection[1])
+
+        if before is not None and _crossed(before, center, *self._rows[flat, :4].tolist()):
+            center = (float(center[0]) - 2 * px, float(center[1]) - 2 * py)
+            px, py = -px, -py
+
+        if self.spline is not None:
+            flat, px, py, distance, tangent, curvature = self._spline_contact(center, flat)
+            if distance > reach:
+                return False
+        else:
+            tangent = tuple(grid.tangents[flat].tolist())
+            curvature = 0.0
+
+        ball.freefall = False
+        ball.checkpoint = (i, int(grid.index[flat]))
+        ball.tangent_vector = tangent
+
+        # y grows down the screen, so the ball is on top when its center is above the line
+        ball.on_top = py < 0
+        # the curve's signed curvature turns left of its tangent, flipped when the ball is on the right
+        side = tangent[0] * py - tangent[1] * px
+        ball.curvature = curvature if side >= 0 else -curvature
+
+        if 0 < distance < reach - CONTACT_SLOP:
+            scale = (reach - CONTACT_SLOP) / distance
+            ball.x = float(center[0]) - px + px * scale
+            ball.y = float(center[1]) - py + py * scale
+        return True
+
+    # the closest point to the ball on the spline piece of a contact segment, moving on to
+    # the next piece along while the closest point is at the shared end. returns the
+    # segment alongside it, the offset from the curve to the center, its length, the
+    # tangent and the curvature
+    def _spline_contact(self, center, flat):
+        spline = self.spline
+        cx, cy = float(center[0]), float(center[1])
+        curve = self.grid.curve[flat]
+        first, last = spline.offsets[curve], spline.offsets[curve + 1]
+
+        piece, t = spline.locate(flat, cx, cy)
+        step = 0
+        for _ in range(3):
+            t, x, y, tx, ty = spline.closest(piece, cx, cy, t)
+            if t == 0 and step <= 0 and piece > first:
+                step, t = -1, 1.0
+            elif t == 1 and step >= 0 and piece < last - 1:
+                step, t = 1, 0.0
+            else:
+                break
+            piece += step
+        return (spline.segment(piece, t), cx - x, cy - y, math.hypot(cx - x, cy - y), (tx, ty),
+                spline.curvature(piece, t))
+
+    # follows a rolling ball along its curve. only the segments within the arc length the
+    # ball can cover this step (plus its own size) either side of the last contact are
+    # tested, so the cost depends on speed and not on how densely the curve was drawn.
+    # where other curves come near the ball their segments are tested too, and the ball
+    # stays on whichever segment it has sunk deepest into, so it can't roll on through a
+    # corner or a wall. before is where its last move started
+    def _local_search(self, center, dt, before):
+        ball, grid = self.ball, self.grid
+
+        curve_idx, seg_idx = ball.checkpoint
+        first, last = grid.offsets[curve_idx], grid.offsets[curve_idx + 1]
+        flat = first + seg_idx
+        reach = math.hypot(ball.xvel, ball.yvel) * dt + ball.radius + self.thicknesses[curve_idx]
+
+        arc = grid.arc[first:last]
+        start = max(np.searchsorted(arc, arc[seg_idx] - reach, side='right') - 1, 0)
+        end = np.searchsorted(arc, arc[seg_idx] + math.sqrt(grid.lengths_sq[flat]) + reach)
+        start, end = max(start, seg_idx - MAX_TRACK_WINDOW), min(end, seg_idx + MAX_TRACK_WINDOW + 1)
+
+        start, end = first + start, first + end
+        if end - start <= SCALAR_WINDOW:
+            hit = self._scalar_contact(center, slice(start, end))
+        else:
+            hit = None
+            mask, projections, distances = self._contact_test(center, slice(start, end))
+            indices = np.where(mask)[0]
+            if len(indices):
+                i = indices[np.argmin(distances[indices] - self._half[start + indices])]
+                hit = (start + i, projections[i], distances[i])
+
+        # other curves are only tested where they come near the ball, and the rest of the
+        # track once it has run off the searched part of its own
+        if hit is None:
+            hits = self._nearby(center, start, end)
+        else:
+            hits = [hit]
+            others = grid.others_near(center, ball.radius + self._pad, curve_idx)
+            if len(others):
+                other = self._scalar_contact(center, others)
+                if other is not None:
+                    hits.append(other)
+
+        hits.sort(key=lambda hit: hit[2] - self._half[hit[0]])
+        for hit in hits:
+            if self._touch(center, *hit, before):
+                self.stats['local_hits' if start <= hit[0] < end else 'transitions'] += 1
+                return
+        self.stats['fallbacks'] += 1
+        ball.freefall = True
+
+    # segments touching the ball right where it is other than those in [skip_start, skip_end),
+    # e.g. where its curve meets or crosses another one, as (flat index, projection, distance)
+    def _nearby(self, center, skip_start, skip_end):
+        ball, grid = self.ball, self.grid
+        candidates = grid.query(center, center, ball.radius + self._pad)
+        candidates = candidates[(candidates < skip_start) | (candidates >= skip_end)]
+
+        mask, projections, distances = self._contact_test(center, candidates)
+        return [(candidates[i], projections[i], distances[i]) for i in np.where(mask)[0]]
+
+    def _broadphase(self, center, dt):
+        ball, grid = self.ball, self.grid
+
+        swept = center + np.array([ball.xvel, ball.yvel + self.g * dt]) * dt
+        candidates = grid.query(center, swept, ball.radius + self._pad)
+        mask, projections, distances = self._contact_test(center, candidates)
+
+        for hit in np.where(mask)[0]:
+            if self._touch(center, candidates[hit], projections[hit], distances[hit]):
+                break
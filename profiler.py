@@ -0,0 +1,121 @@
+import csv
+import json
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+from contextlib import nullcontext
+
+_NO_TIMER = nullcontext()
+
+# times one phase and adds it to the profiler's current frame when the with block ends
+class _Timer:
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.profiler.current[self.name] += time.perf_counter() - self.start
+
+
+# named phase timers and counters, grouped into frames. the last `history` frames are
+# kept for the overlay averages and for export
+class Profiler:
+    def __init__(self, history=300, enabled=True):
+        self.enabled = enabled
+        self.current = defaultdict(float)
+        self.frames = deque(maxlen=history)
+        # when each kept frame was closed, for lining up another profiler's frames in merge()
+        self.ends = deque(maxlen=history)
+        self.counters = defaultdict(int)
+        self._timers = {}
+        self._last = time.perf_counter()
+
+    # with profiler.phase('broadphase'): ...
+    def phase(self, name):
+        if not self.enabled:
+            return _NO_TIMER
+        timer = self._timers.get(name)
+        if timer is None:
+            timer = self._timers[name] = _Timer(self, name)
+        return timer
+
+    # time since the last lap or frame goes to the named phase, for timing a loop body
+    # piece by piece without nesting it all in with blocks
+    def lap(self, name):
+        now = time.perf_counter()
+        if self.enabled:
+            self.current[name] += now - self._last
+        self._last = now
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    # closes the current frame, phases that didn't run this frame count as zero
+    def frame(self):
+        now = time.perf_counter()
+        if self.enabled and self.current:
+            self.frames.append(dict(self.current))
+            self.ends.append(now)
+        self.current = defaultdict(float)
+        self._last = now
+
+    def reset(self):
+        self.current = defaultdict(float)
+        self.frames.clear()
+        self.ends.clear()
+        self.counters.clear()
+
+    # adds another profiler's phases and counters to this one, e.g. a worker thread's once
+    # it has stopped. each of its frames goes into the kept frame here that it ended during,
+    # ones that ended after the last kept frame go into the current one
+    def merge(self, other):
+        if not self.enabled:
+            return
+        ends = list(self.ends)
+        for frame, end in zip(other.frames, other.ends):
+            k = bisect_left(ends, end)
+            target = self.frames[k] if k < len(ends) else self.current
+            for name, seconds in frame.items():
+                target[name] = target.get(name, 0) + seconds
+        for name, value in other.counters.items():
+            self.counters[name] += value
+
+    def phases(self):
+        names = {}
+        for frame in self.frames:
+            names.update(dict.fromkeys(frame))
+        return list(names)
+
+    # per phase milliseconds over the kept frames
+    def summary(self):
+        result = {}
+        for name in self.phases():
+            times = [frame.get(name, 0) * 1000 for frame in self.frames]
+            result[name] = {'last_ms': times[-1], 'mean_ms': sum(times) / len(times), 'max_ms': max(times)}
+        return result
+
+    # writes the kept frames as csv (one row per frame, ms per phase) or, for a .json
+    # path, the summary together with the counters and any extra ones passed in
+    def export(self, path, counters=None):
+        all_counters = dict(self.counters)
+        all_counters.update(counters or {})
+
+        with open(path, 'w', newline='') as file:
+            if str(path).endswith('.json'):
+                json.dump({'frames': len(self.frames), 'phases': self.summary(), 'counters': all_counters}, file, indent=2)
+                return
+
+            names = self.phases()
+            writer = csv.writer(file)
+            writer.writerow(['frame'] + [f'{name}_ms' for name in names])
+            for i, frame in enumerate(self.frames):
+                writer.writerow([i] + [round(frame.get(name, 0) * 1000, 4) for name in names])
+
+# shared stand in when nothing is being profiled
+NULL_PROFILER = Profiler(history=1, enabled=False)
@@ -0,0 +1,206 @@
+from collections import OrderedDict
+
+import numpy as np
+import pygame
+from spline import SplineTrack
+from strokes import StrokeIndex
+from world import CHUNK_SIZE
+
+# most chunks of drawn track kept around, the ones out of view longest are dropped first
+CHUNK_CACHE = 32
+# how far past a stroke's points its line can reach, half the widest line there is
+LINE_PAD = 32
+
+# where the view is in the world, its top left corner. the screen shows whole pixels
+# of the world, so offset is that corner rounded, and both ways of converting use it
+class Camera:
+    def __init__(self, size, x=0, y=0):
+        self.width, self.height = size
+        self.x, self.y = x, y
+        # where follow() is easing the view to, None while it stands still
+        self.target = None
+
+    @property
+    def offset(self):
+        return round(self.x), round(self.y)
+
+    def center_on(self, pos):
+        self.x = pos[0] - self.width / 2
+        self.y = pos[1] - self.height / 2
+
+    # keeps pos in view. the view stands still while pos is away from its edges, and once
+    # pos comes within margin (a share of the view) of one, eases over until pos is back
+    # in the middle, never letting it get closer than half the margin to the edge. a
+    # still view lets a frame push only what changed to the display, which a view
+    # scrolling after the ball every frame never does
+    def follow(self, pos, dt, margin=0.2, stiffness=8):
+        tx, ty = self.target or (self.x, self.y)
+        if not self.width * margin <= pos[0] - tx <= self.width * (1 - margin):
+            tx = pos[0] - self.width / 2
+        if not self.height * margin <= pos[1] - ty <= self.height * (1 - margin):
+            ty = pos[1] - self.height / 2
+
+        blend = min(1, stiffness * dt)
+        self.x += (tx - self.x) * blend
+        self.y += (ty - self.y) * blend
+        self.x = min(max(self.x, pos[0] - self.width * (1 - margin / 2)), pos[0] - self.width * margin / 2)
+        self.y = min(max(self.y, pos[1] - self.height * (1 - margin / 2)), pos[1] - self.height * margin / 2)
+        if abs(tx - self.x) < 0.5 and abs(ty - self.y) < 0.5:
+            self.x, self.y = tx, ty
+            self.target = None
+        else:
+            self.target = tx, ty
+
+    def to_screen(self, pos):
+        ox, oy = self.offset
+        return pos[0] - ox, pos[1] - oy
+
+    def to_world(self, pos):
+        ox, oy = self.offset
+        return pos[0] + ox, pos[1] + oy
+
+
+# a stroke with its points swapped for ones sampled along the spline a smooth run rolls
+# on, so the line drawn is the one the ball touches
+def smooth_stroke(sublist, steps=8):
+    point_list = np.array(sublist[1:], dtype=float).reshape(-1, 2)
+    point_list = point_list[np.append(True, np.any(np.diff(point_list, axis=0) != 0, axis=1))]
+    if len(point_list) < 2:
+        return sublist
+    return [sublist[0]] + [tuple(point) for point in SplineTrack([point_list]).sample(steps)[0].tolist()]
+
+# offscreen copy of the background with the part of the track in view drawn on top, so a
+# frame only has to blit one surface instead of redrawing every polyline. the track is
+# drawn into world chunks that are kept between frames, so scrolling only draws chunks
+# as they come into view and a long track never has to be drawn all at once. strokes
+# are added as they grow and the chunks are only redrawn when strokes are removed or
+# replaced. a smooth layer draws each stroke as its spline, for tracks that don't change
+# while it's shown, extend() still draws straight segments
+class TrackLayer:
+    def __init__(self, size, background, chunk_size=CHUNK_SIZE, smooth=False):
+        self.size = size
+        self.background = background
+        self.chunk_size = chunk_size
+        self.smooth = smooth
+        self.surface = pygame.Surface(size)
+        self.offset = (0, 0)
+        self._chunks = OrderedDict()
+        self.redraw([])
+
+    # index is the points' StrokeIndex when the caller keeps one up to date
+    def redraw(self, points, index=None):
+        if self.smooth:
+            # the curves bow out past the points, so they get an index of their own
+            points = [smooth_stroke(sublist) if len(sublist) >= 3 else sublist for sublist in points]
+            index = None
+        self.points = points
+        self.index = index if index is not None else StrokeIndex(points)
+        self._chunks.clear()
+        self._compose()
+
+    # moves the view to a camera offset, returns whether it changed. over a plain color
+    # what's still in view is scrolled across and only the strips it uncovers are drawn,
+    # a background image stays put on the screen so everything is drawn again
+    def view(self, offset):
+        if offset == self.offset:
+            return False
+        dx, dy = self.offset[0] - offset[0], self.offset[1] - offset[1]
+        self.offset = offset
+
+        width, height = self.size
+        if isinstance(self.background, pygame.Surface) or abs(dx) >= width or abs(dy) >= height:
+            self._compose()
+            return True
+
+        self.surface.scroll(dx, dy)
+        if dx:
+            self._compose(pygame.Rect(0 if dx > 0 else width + dx, 0, abs(dx), height))
+        if dy:
+            self._compose(pygame.Rect(0, 0 if dy > 0 else height + dy, width, abs(dy)))
+        return True
+
+    # draws just the newest segment of a stroke the pencil has appended to
+    def extend(self, sublist):
+        if len(sublist) < 3:
+            return
+        (ax, ay), (bx, by) = sublist[-2], sublist[-1]
+        color, width = sublist[0][1], sublist[0][0]
+
+        for (kx, ky), chunk in self._chunks.items():
+            if chunk is None:
+                continue
+            ox, oy = kx * self.chunk_size, ky * self.chunk_size
+            pygame.draw.line(chunk, color, (ax - ox, ay - oy), (bx - ox, by - oy), width)
+        # a chunk that was empty before has something in it now
+        for key in [key for key, chunk in self._chunks.items() if chunk is None]:
+            del self._chunks[key]
+
+        ox, oy = self.offset
+        pygame.draw.line(self.surface, color, (ax - ox, ay - oy), (bx - ox, by - oy), width)
+
+    # puts the layer back over an area of the target, e.g. where the ball was last frame
+    def restore(self, target, rect):
+        target.blit(self.surface, rect, rect)
+
+    # draws the background and the chunks over an area of the surface, all of it by default
+    def _compose(self, area=None):
+        area = area or self.surface.get_rect()
+        self.surface.set_clip(area)
+        if isinstance(self.background, pygame.Surface):
+            self.surface.blit(self.background, area, area)
+        else:
+            self.surface.fill(self.background, area)
+
+        size = self.chunk_size
+        ox, oy = self.offset[0] + area.x, self.offset[1] + area.y
+        for kx in range(ox // size, (ox + area.width - 1) // size + 1):
+            for ky in range(oy // size, (oy + area.height - 1) // size + 1):
+                chunk = self._chunk((kx, ky))
+                if chunk is not None:
+                    self.surface.blit(chunk, (kx * size - self.offset[0], ky * size - self.offset[1]))
+        self.surface.set_clip(None)
+
+    # the strokes crossing one chunk drawn on a transparent surface, None if there aren't any
+    def _chunk(self, key):
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+            return self._chunks[key]
+
+        size = self.chunk_size
+        ox, oy = key[0] * size, key[1] * size
+        near = self.index.near((ox + size / 2, oy + size / 2), size / 2 + LINE_PAD)
+        chunk = None
+        for i in near:
+            sublist = self.points[i]
+            if len(sublist) < 3:
+                continue
+            if chunk is None:
+                chunk = pygame.Surface((size, size), pygame.SRCALPHA)
+            pygame.draw.lines(chunk, sublist[0][1], False, [(x - ox, y - oy) for x, y in sublist[1:]], sublist[0][0])
+
+        self._chunks[key] = chunk
+        if len(self._chunks) > CHUNK_CACHE:
+            self._chunks.popitem(last=False)
+        return chunk
+
+# profiler overlay in the top right corner of the surface, last and average frame time of
+# each phase followed by the counters. returns the area it covered
+def draw_profiler(surface, font, profiler, counters=None):
+    rows = [('phase', 'last', 'avg')]
+    rows += [(name, f'{times["last_ms"]:.2f}', f'{times["mean_ms"]:.2f}') for name, times in profiler.summary().items()]
+    all_counters = dict(profiler.counters)
+    all_counters.update(counters or {})
+    rows += [(name, '', str(value)) for name, value in all_counters.items()]
+
+    line_height = font.get_linesize()
+    panel = pygame.Surface((240, line_height * len(rows) + 10), pygame.SRCALPHA)
+    panel.fill((0, 0, 0, 180))
+    for i, (name, last, avg) in enumerate(rows):
+        y = 5 + i * line_height
+        panel.blit(font.render(name, 1, 'white'), (5, y))
+        for text, right in ((last, 170), (avg, 235)):
+            if text:
+                label = font.render(text, 1, 'white')
+                panel.blit(label, (right - label.get_width(), y))
+
+    return surface.blit(panel, (surface.get_width() - panel.get_width() - 10, 10))
@@ -0,0 +1,90 @@
+import numpy as np
+
+# one physics step of a run
+FRAME = np.dtype([('t', '<f8'), ('x', '<f4'), ('y', '<f4'), ('xvel', '<f4'), ('yvel', '<f4'),
+                  ('freefall', '?'), ('curve', '<i4'), ('seg', '<i4')])
+
+# replay log layout: 8 byte magic, uint64 frame count, then the frames back to back
+MAGIC = b'PSREPLAY'
+HEADER = np.dtype([('magic', 'S8'), ('frames', '<u8')])
+
+# default number of steps kept, about 18 minutes of sim time at 240 steps a second
+CAPACITY = 1 << 18
+
+# ring buffer of per step ball state, once full the oldest steps are overwritten
+class Recorder:
+    def __init__(self, capacity=CAPACITY):
+        self.buffer = np.zeros(capacity, dtype=FRAME)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, len(self.buffer))
+
+    def record(self, t, ball):
+        if ball.checkpoint is None or ball.freefall:
+            curve, seg = -1, -1
+        else:
+            curve, seg = ball.checkpoint
+        self.buffer[self.count % len(self.buffer)] = (t, ball.x, ball.y, ball.xvel, ball.yvel, ball.freefall, curve, seg)
+        self.count += 1
+
+    # recorded steps, oldest first
+    def frames(self):
+        if self.count <= len(self.buffer):
+            return self.buffer[:self.count].copy()
+        split = self.count % len(self.buffer)
+        return np.concatenate((self.buffer[split:], self.buffer[:split]))
+
+    def replay(self):
+        return Replay(self.frames())
+
+    def save(self, path):
+        header = np.zeros(1, dtype=HEADER)
+        header[0] = (MAGIC, len(self))
+        with open(path, 'wb') as file:
+            file.write(header.tobytes())
+            file.write(self.frames().tobytes())
+
+
+# a recorded run that can be looked at from any point in time without simulating it again
+class Replay:
+    def __init__(self, frames):
+        self.frames = frames
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        header = np.fromfile(path, dtype=HEADER, count=1)
+        if len(header) == 0 or header['magic'][0] != MAGIC:
+            raise ValueError(f'{path} is not a replay file')
+
+        count = int(header['frames'][0])
+        if mmap and count:
+            return cls(np.memmap(path, dtype=FRAME, mode='r', offset=HEADER.itemsize, shape=(count,)))
+        with open(path, 'rb') as file:
+            file.seek(HEADER.itemsize)
+            return cls(np.fromfile(file, dtype=FRAME, count=count))
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def start(self):
+        return float(self.frames['t'][0]) if len(self.frames) else 0.0
+
+    @property
+    def end(self):
+        return float(self.frames['t'][-1]) if len(self.frames) else 0.0
+
+    # ball state at time t as a dict, position and velocity blended between the two
+    # steps either side of it and contact state taken from the earlier one
+    def seek(self, t):
+        times = self.frames['t']
+        i = int(np.clip(np.searchsorted(times, t, side='right') - 1, 0, len(times) - 1))
+        a = self.frames[i]
+        b = self.frames[min(i + 1, len(times) - 1)]
+        span = b['t'] - a['t']
+        alpha = float(np.clip((t - a['t']) / span, 0, 1)) if span > 0 else 0.0
+
+        state = {name: float(a[name] + (b[name] - a[name]) * alpha) for name in ('x', 'y', 'xvel', 'yvel')}
+        state.update(t=float(t), freefall=bool(a['freefall']), checkpoint=None if a['curve'] < 0 else (int(a['curve']), int(a['seg'])))
+        return state
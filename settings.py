@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+
+# how long the writer waits for more changes before saving, in s. a burst of changes
+# (dragging through colors, typing a value) ends up as one write
+WRITE_DELAY = 0.5
+
+# user settings kept in memory, so reading and changing them never touches the disk on
+# the caller's thread. a background thread writes them out a short while after the last
+# change, to a temporary file first so a crash mid write can't leave a broken file
+class Settings:
+    def __init__(self, path, defaults=None, delay=WRITE_DELAY):
+        self.path = path
+        self.delay = delay
+        self.values = dict(defaults or {})
+        try:
+            with open(path) as file:
+                self.values.update(json.load(file))
+        except (OSError, ValueError):
+            pass
+
+        self._dirty = False
+        self._closed = False
+        self._changed = threading.Condition()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    # settings.update(gravity=500, friction=0.2), values have to be json types
+    def update(self, **changes):
+        with self._changed:
+            changes = {key: value for key, value in changes.items() if self.values.get(key) != value}
+            if not changes:
+                return
+            self.values.update(changes)
+            self._dirty = True
+            self._changed.notify()
+
+    # writes whatever hasn't been written yet and stops the writer
+    def close(self):
+        with self._changed:
+            self._closed = True
+            self._changed.notify()
+        self._writer.join()
+
+    def _write_loop(self):
+        while True:
+            with self._changed:
+                while not self._dirty and not self._closed:
+                    self._changed.wait()
+                if not self._dirty:
+                    return
+                # every change that comes in starts the wait over
+                while not self._closed and self._changed.wait(self.delay):
+                    pass
+                values = dict(self.values)
+                self._dirty = False
+
+            try:
+                with open(self.path + '.tmp', 'w') as file:
+                    json.dump(values, file, indent=2)
+                os.replace(self.path + '.tmp', self.path)
+            except OSError:
+                pass
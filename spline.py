@@ -0,0 +1,283 @@
+import math
+import numpy as np
+
+# newton steps a closest point query takes, the segment projection is a good enough
+# start that a few always get it to well under a pixel
+NEWTON_STEPS = 4
+# how far a piece spanning several segments may stray from the curve fitted one piece
+# per segment, in px
+TOLERANCE = 0.5
+# most segments one piece spans
+MAX_SPAN = 64
+# a curve turning by more than this many degrees at a point keeps a sharp corner there
+CORNER_ANGLE = 60
+
+# unit direction of each row, zero rows stay zero
+def _unit(vectors):
+    lengths = np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors), where=lengths > 0)
+
+# cubic hermite pieces from each p0 to p1, leaving along d0 and arriving along d1 (unit
+# rows). each piece scales its tangents by its own chord length, so uneven point spacing
+# doesn't make the curve overshoot or loop. the scale grows with how far the tangent
+# turns off the chord, by 1 / cos²(angle / 2) which makes the piece follow a circular arc
+# closely, capped at twice the chord.
+# returns (pieces, 4, 2) power basis coefficients, P(t) = c0 + c1 t + c2 t² + c3 t³
+def _hermite(p0, p1, d0, d1):
+    chords = p1 - p0
+    lengths = np.linalg.norm(chords, axis=1)[:, np.newaxis]
+    along = _unit(chords)
+    cos0 = np.einsum('ij, ij -> i', d0, along)[:, np.newaxis]
+    cos1 = np.einsum('ij, ij -> i', d1, along)[:, np.newaxis]
+    m0 = d0 * lengths * 2 / (1 + np.maximum(cos0, 0))
+    m1 = d1 * lengths * 2 / (1 + np.maximum(cos1, 0))
+    return np.stack((p0, m0, 3 * (p1 - p0) - 2 * m0 - m1, 2 * (p0 - p1) + m0 + m1), axis=1)
+
+# points on pieces, at parameters t (pieces, samples), as (pieces, samples, 2)
+def _evaluate(coeffs, t):
+    basis = np.stack((np.ones_like(t), t, t * t, t * t * t), axis=-1)
+    return np.einsum('nsk, nkd -> nsd', basis, coeffs)
+
+# unit tangents each point is reached along and left along, for points laid out curve
+# after curve. both run parallel to the line between the point's neighbours, except at a
+# corner, which is reached and left along its own segments. the ends take their
+# neighbour's tangent mirrored across the end segment, which is exact for a circle, and a
+# single segment is just straight. seg_start and seg_end are each segment's two points,
+# returns the two tangent arrays and which points are corners
+def _tangents(points, seg_start, seg_end):
+    along = _unit(points[seg_end] - points[seg_start])
+    seg_in, seg_out = np.full(len(points), -1), np.full(len(points), -1)
+    seg_in[seg_end] = seg_out[seg_start] = np.arange(len(along))
+    interior = np.flatnonzero((seg_in >= 0) & (seg_out >= 0))
+
+    directions = np.zeros_like(points)
+    directions[interior] = _unit(points[interior + 1] - points[interior - 1])
+    corner = np.zeros(len(points), dtype=bool)
+    corner[interior] = (np.einsum('ij, ij -> i', along[seg_in[interior]], along[seg_out[interior]]) <
+                        math.cos(math.radians(CORNER_ANGLE)))
+    into, out_of = directions, directions.copy()
+    corners = np.flatnonzero(corner)
+    into[corners] = along[seg_in[corners]]
+    out_of[corners] = along[seg_out[corners]]
+
+    first = np.flatnonzero((seg_out >= 0) & (seg_in < 0))
+    into[first] = out_of[first] = _mirror(into[first + 1], along[seg_out[first]], seg_out[first + 1] < 0)
+    last = np.flatnonzero((seg_in >= 0) & (seg_out < 0))
+    into[last] = out_of[last] = _mirror(out_of[last - 1], along[seg_in[last]], seg_in[last - 1] < 0)
+    return into, out_of, corner
+
+# tangents mirrored across the unit directions along, or along itself where single
+def _mirror(tangents, along, single):
+    mirrored = 2 * np.einsum('ij, ij -> i', tangents, along)[:, np.newaxis] * along - tangents
+    return np.where(single[:, np.newaxis], along, mirrored)
+
+# pieces each spanning segments [heads, ends) of the same curve, as (pieces, 4, 2)
+# coefficients, and whether each stays within TOLERANCE of its reference points and
+# passes them in order, with the parameter at each of its points. the reference points
+# are the points along the span with the one piece per segment fit's midpoints between
+# them, all the spans are fitted at once laid end to end
+def _fit_spans(points, mids, seg_start, seg_end, into, out_of, heads, ends):
+    first, last = seg_start[heads], seg_end[ends - 1]
+    coeffs = _hermite(points[first], points[last], out_of[first], into[last])
+
+    lengths = ends - heads
+    counts = 2 * lengths + 1
+    rows = np.repeat(np.arange(len(heads)), counts)
+    group = np.cumsum(counts) - counts
+    local = np.arange(counts.sum()) - group[rows]
+    segs = heads[rows] + np.minimum(local // 2, lengths[rows] - 1)
+    reference = points[seg_start[segs]]
+    mid, end = local % 2 == 1, local == 2 * lengths[rows]
+    reference[mid] = mids[segs[mid]]
+    reference[end] = points[seg_end[segs[end]]]
+
+    # each reference point's closest point on its piece by newton's method like
+    # SplineTrack.closest, from its share of the way along the reference points
+    steps = np.linalg.norm(np.diff(reference, axis=0), axis=1)
+    steps[rows[1:] != rows[:-1]] = 0
+    arc = np.concatenate(([0], np.cumsum(steps)))
+    arc -= arc[group][rows]
+    total = arc[group + counts - 1][rows]
+    t = np.divide(arc, total, out=np.zeros(len(arc)), where=total > 0)[:, np.newaxis]
+    a, b, c, d = np.moveaxis(coeffs[rows], 1, 0)
+    for _ in range(NEWTON_STEPS):
+        offset = ((d * t + c) * t + b) * t + a - reference
+        tangent = (3 * d * t + 2 * c) * t + b
+        slope = np.einsum('ij, ij -> i', tangent, tangent) + np.einsum('ij, ij -> i', offset, 6 * d * t + 2 * c)
+        step = np.divide(np.einsum('ij, ij -> i', offset, tangent), slope, out=np.zeros(len(t)), where=slope > 0)
+        t = (t - step[:, np.newaxis]).clip(0, 1)
+
+    offset = ((d * t + c) * t + b) * t + a - reference
+    fits = np.maximum.reduceat(np.einsum('ij, ij -> i', offset, offset), group) <= TOLERANCE * TOLERANCE
+    params = t[local % 2 == 0, 0]
+    starts = np.cumsum(lengths + 1) - (lengths + 1)
+    params[starts], params[starts + lengths] = 0, 1
+    at = rows[local % 2 == 0]
+    backwards = (np.diff(params) < 0) & (at[1:] == at[:-1])
+    fits &= np.bincount(at[1:][backwards], minlength=len(heads)) == 0
+    return coeffs, fits, params
+
+# cubic pieces through the points of every curve, each spanning as many segments as it
+# can while staying within TOLERANCE of the curve fitted one piece per segment, and never
+# past a corner. the segments between corners are split into blocks of 2, 4, 8 and so on
+# up to MAX_SPAN, and a block becomes one piece if both its halves did and it fits.
+# returns the (pieces, 4, 2) coefficients, the piece of each segment (laid out curve after
+# curve) and each segment's (start, end) parameters on its piece
+def fit_curves(new_points):
+    lengths = np.array([len(point_list) for point_list in new_points], dtype=int)
+    counts = np.maximum(lengths - 1, 0)
+    if not counts.sum():
+        return np.zeros((0, 4, 2)), np.zeros(0, dtype=int), np.zeros((0, 2))
+    points = np.concatenate([np.asarray(point_list, dtype=float).reshape(-1, 2) for point_list in new_points])
+    curve = np.repeat(np.arange(len(counts)), counts)
+    seg_offsets = np.cumsum(counts) - counts
+    seg_start = np.arange(counts.sum()) - seg_offsets[curve] + (np.cumsum(lengths) - lengths)[curve]
+    seg_end = seg_start + 1
+
+    into, out_of, corner = _tangents(points, seg_start, seg_end)
+    fine = _hermite(points[seg_start], points[seg_end], out_of[seg_start], into[seg_end])
+    mids = _evaluate(fine, np.full((len(fine), 1), 0.5))[:, 0]
+
+    # runs of segments between corners and where each segment is along its run
+    head = (np.arange(len(curve)) == seg_offsets[curve]) | corner[seg_start]
+    run = np.cumsum(head) - 1
+    run_heads = np.flatnonzero(head)
+    run_ends = np.append(run_heads[1:], len(curve))
+    along = np.arange(len(curve)) - run_heads[run]
+
+    # every segment starts out as its own piece. depth counts the block sizes each
+    # segment's block has made it through, by fitting or by being its own first half
+    pieces = [fine]
+    owner = np.arange(len(curve))
+    spans = np.tile([0.0, 1.0], (len(curve), 1))
+    depth = np.zeros(len(curve), dtype=int)
+    total, level, size = len(fine), 1, 2
+    while size <= MAX_SPAN:
+        heads = np.flatnonzero(along % size == 0)
+        ends = np.minimum(heads + size, run_ends[run[heads]])
+        ready = np.minimum.reduceat(depth, heads) == level - 1
+        # a block no longer than its first half is just that half, which already fitted
+        carried = ready & (ends - heads <= size // 2)
+        depth[np.repeat(carried, ends - heads)] = level
+        heads, ends = heads[ready & ~carried], ends[ready & ~carried]
+        if not len(heads):
+            break
+
+        coeffs, fits, params = _fit_spans(points, mids, seg_start, seg_end, into, out_of, heads, ends)
+        blocks = np.repeat(np.arange(len(heads)), ends - heads)
+        offset = np.arange(len(blocks)) - (np.cumsum(ends - heads) - (ends - heads))[blocks]
+        at = (np.cumsum(ends - heads + 1) - (ends - heads + 1))[blocks] + offset
+        fitted = fits[blocks]
+        segs = (heads[blocks] + offset)[fitted]
+        owner[segs] = total + blocks[fitted]
+        spans[segs] = np.stack((params[at], params[at + 1]), axis=1)[fitted]
+        depth[segs] = level
+
+        pieces.append(coeffs)
+        total += len(coeffs)
+        level, size = level + 1, size * 2
+
+    starts = np.append(True, owner[1:] != owner[:-1])
+    return np.concatenate(pieces)[owner[starts]], np.cumsum(starts) - 1, spans
+
+# a track as cubic pieces, several segments of a curve to a piece where the curve is
+# smooth enough. the segment arrays are laid out like SegmentGrid's flat ones, each
+# segment knowing its piece and the part of it that runs alongside the segment, so a
+# contact found on the polyline can be refined on the curve through it
+class SplineTrack:
+    def __init__(self, new_points):
+        self.coeffs, self.piece, self.spans = fit_curves(new_points)
+        # where each curve's pieces start, and where each piece's segments start in the
+        # flat arrays, each with the total on the end
+        self.knots = np.concatenate(([0], np.cumsum(np.bincount(self.piece, minlength=len(self.coeffs))))).astype(int)
+        counts = [max(len(point_list) - 1, 0) for point_list in new_points]
+        curve = np.repeat(np.arange(len(counts)), counts)
+        per_curve = np.bincount(curve[self.knots[:-1]], minlength=len(counts))
+        self.offsets = np.concatenate(([0], np.cumsum(per_curve))).astype(int)
+
+        starts = np.concatenate([point_list[:-1] for point_list in new_points] + [np.zeros((0, 2))]).astype(float)
+        vectors = np.concatenate([np.diff(point_list, axis=0) for point_list in new_points] + [np.zeros((0, 2))])
+        self._rows = np.column_stack((starts, vectors, self.spans))
+
+        # how far each segment's part of its piece strays from the straight segment, so
+        # tests against the segments can be widened enough not to miss the curve
+        t = self.spans[:, :1] + (self.spans[:, 1:] - self.spans[:, :1]) * np.linspace(0, 1, 9)
+        offsets = _evaluate(self.coeffs[self.piece], t) - starts[:, np.newaxis]
+        lengths = np.linalg.norm(vectors, axis=1)
+        cross = np.abs(offsets[..., 0] * vectors[:, np.newaxis, 1] - offsets[..., 1] * vectors[:, np.newaxis, 0])
+        self.bulge = np.divide(cross.max(axis=1, initial=0), lengths, out=np.zeros(len(lengths)), where=lengths > 0)
+
+    def __len__(self):
+        return len(self.coeffs)
+
+    # the piece a segment lies on, and the parameter on it alongside where (px, py)
+    # projects onto the segment, a starting point for closest()
+    def locate(self, flat, px, py):
+        sx, sy, vx, vy, t0, t1 = self._rows[flat].tolist()
+        length_sq = vx * vx + vy * vy
+        scalar = min(max(((px - sx) * vx + (py - sy) * vy) / length_sq, 0), 1) if length_sq else 0
+        return int(self.piece[flat]), t0 + (t1 - t0) * scalar
+
+    # the segment running alongside parameter t of a piece
+    def segment(self, piece, t):
+        first, last = self.knots[piece], self.knots[piece + 1]
+        return int(min(first + np.searchsorted(self.spans[first:last, 1], t), last - 1))
+
+    # point and unit tangent at parameter t of a piece, as plain floats
+    def evaluate(self, piece, t):
+        (ax, ay), (bx, by), (cx, cy), (dx, dy) = self.coeffs[piece].tolist()
+        x = ((dx * t + cx) * t + bx) * t + ax
+        y = ((dy * t + cy) * t + by) * t + ay
+        tx = (3 * dx * t + 2 * cx) * t + bx
+        ty = (3 * dy * t + 2 * cy) * t + by
+        length = math.hypot(tx, ty) or 1
+        return x, y, tx / length, ty / length
+
+    # signed curvature at parameter t of a piece, positive where the curve turns towards
+    # the left of its tangent, (-ty, tx)
+    def curvature(self, piece, t):
+        _, (bx, by), (cx, cy), (dx, dy) = self.coeffs[piece].tolist()
+        tx = (3 * dx * t + 2 * cx) * t + bx
+        ty = (3 * dy * t + 2 * cy) * t + by
+        ax = 6 * dx * t + 2 * cx
+        ay = 6 * dy * t + 2 * cy
+        speed = math.hypot(tx, ty)
+        return (tx * ay - ty * ax) / speed ** 3 if speed else 0.0
+
+    # closest point on a piece to (px, py) by newton's method on (P(t) - p)·P'(t) = 0,
+    # starting from t or the projection onto the piece's chord. returns the parameter,
+    # the point and the unit tangent there
+    def closest(self, piece, px, py, t=None):
+        (ax, ay), (bx, by), (cx, cy), (dx, dy) = self.coeffs[piece].tolist()
+
+        if t is None:
+            vx, vy = bx + cx + dx, by + cy + dy
+            length_sq = vx * vx + vy * vy
+            t = min(max(((px - ax) * vx + (py - ay) * vy) / length_sq, 0), 1) if length_sq else 0
+
+        for _ in range(NEWTON_STEPS):
+            ox = ((dx * t + cx) * t + bx) * t + ax - px
+            oy = ((dy * t + cy) * t + by) * t + ay - py
+            tx = (3 * dx * t + 2 * cx) * t + bx
+            ty = (3 * dy * t + 2 * cy) * t + by
+            f = ox * tx + oy * ty
+            slope = tx * tx + ty * ty + ox * (6 * dx * t + 2 * cx) + oy * (6 * dy * t + 2 * cy)
+            if slope <= 0:
+                break
+            t = min(max(t - f / slope, 0), 1)
+
+        x, y, tx, ty = self.evaluate(piece, t)
+        return t, x, y, tx, ty
+
+    # every curve sampled at `steps` points along each of its segments, as point lists
+    # for drawing
+    def sample(self, steps=8):
+        t = self.spans[:, :1] + (self.spans[:, 1:] - self.spans[:, :1]) * np.linspace(0, 1, steps + 1)[:-1]
+        xy = _evaluate(self.coeffs[self.piece], t)
+        curves = []
+        for first, last in zip(self.knots[self.offsets[:-1]], self.knots[self.offsets[1:]]):
+            if first == last:
+                continue
+            end = self.coeffs[self.piece[last - 1]].sum(axis=0)
+            curves.append(np.vstack((xy[first:last].reshape(-1, 2), end)))
+        return curves
@@ -0,0 +1,182 @@
+import math
+import numpy as np
+
+EMPTY_BOX = (np.inf, np.inf, -np.inf, -np.inf)
+
+def _box(sublist):
+    if len(sublist) < 2:
+        return EMPTY_BOX
+    point_list = np.array(sublist[1:], dtype=float)
+    return (*point_list.min(axis=0), *point_list.max(axis=0))
+
+# bounding box of every stroke in edit()'s points list, row for row, so tools only
+# have to look at the strokes near the cursor
+class StrokeIndex:
+    def __init__(self, points):
+        self.rebuild(points)
+
+    def rebuild(self, points):
+        self.boxes = np.array([_box(sublist) for sublist in points], dtype=float).reshape(-1, 4)
+
+    # a new empty stroke at the end of the list
+    def add_stroke(self):
+        self.boxes = np.vstack((self.boxes, EMPTY_BOX))
+
+    def add_point(self, i, pos):
+        box = self.boxes[i]
+        box[0], box[1] = min(box[0], pos[0]), min(box[1], pos[1])
+        box[2], box[3] = max(box[2], pos[0]), max(box[3], pos[1])
+
+    # stroke i was cut into the given strokes
+    def replace(self, i, sublists):
+        rows = np.array([_box(sublist) for sublist in sublists], dtype=float).reshape(-1, 4)
+        self.boxes = np.concatenate((self.boxes[:i], rows, self.boxes[i + 1:]))
+
+    # strokes whose boxes come within radius of pos
+    def near(self, pos, radius):
+        b = self.boxes
+        return np.flatnonzero((b[:, 0] - radius <= pos[0]) & (b[:, 2] + radius >= pos[0]) &
+                              (b[:, 1] - radius <= pos[1]) & (b[:, 3] + radius >= pos[1]))
+
+
+# cuts the part of every stroke inside the circle of radius around pos out of it, splitting
+# strokes where the cut lands in the middle and ending the pieces on the circle, so long
+# straight segments get cut as well. only strokes near pos are looked at, returns whether
+# anything changed
+def erase(points, index, pos, radius):
+    erased = False
+
+    # back to front so splitting a stroke doesn't shift the ones still to do
+    for i in index.near(pos, radius)[::-1]:
+        sublist = points[i]
+        pieces = _cut(sublist, pos, radius)
+        if pieces is None:
+            continue
+
+        points[i:i + 1] = pieces
+        index.replace(i, pieces)
+        erased = True
+
+    return erased
+
+# the pieces of a stroke left outside the circle, or None if the circle misses it
+def _cut(sublist, pos, radius):
+    point_list = np.array(sublist[1:], dtype=float).reshape(-1, 2)
+    if len(point_list) == 1:
+        return [] if np.hypot(*(point_list[0] - pos)) <= radius else None
+
+    # where each segment a + t v enters and leaves the circle, t in [0, 1]
+    a, v = point_list[:-1], np.diff(point_list, axis=0)
+    d = a - pos
+    qa = np.einsum('ij, ij -> i', v, v)
+    qb = np.einsum('ij, ij -> i', v, d)
+    qc = np.einsum('ij, ij -> i', d, d) - radius * radius
+    disc = qb * qb - qa * qc
+    root = np.sqrt(np.maximum(disc, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_in = np.where(qa > 0, (-qb - root) / qa, np.where(qc <= 0, 0, 1))
+        t_out = np.where(qa > 0, (-qb + root) / qa, np.where(qc <= 0, 1, 0))
+    t_in, t_out = np.maximum(t_in, 0), np.minimum(t_out, 1)
+    hit = (disc >= 0) & (t_in < t_out)
+    if not hit.any():
+        return None
+
+    pieces = []
+    piece = [sublist[0], sublist[1]]
+    for k in range(len(v)):
+        end = sublist[k + 2]
+        if not hit[k]:
+            piece.append(end)
+            continue
+        if t_in[k] > 0:
+            piece.append(tuple((a[k] + v[k] * t_in[k]).tolist()))
+        if len(piece) >= 3:
+            pieces.append(piece)
+        piece = [sublist[0]]
+        if t_out[k] < 1:
+            piece += [tuple((a[k] + v[k] * t_out[k]).tolist()), end]
+    if len(piece) >= 3:
+        pieces.append(piece)
+    return pieces
+
+# pencil input is resampled to points this far apart along the path the cursor took,
+# and a point only becomes a vertex of the stroke once the points after it stop
+# fitting within this distance of a single line
+STROKE_SPACING = 4
+STROKE_TOLERANCE = 1
+# most resampled points held back waiting for the next vertex
+MAX_PENDING = 64
+
+def _segment_distance(point, a, b):
+    ax, ay = a
+    vx, vy = b[0] - ax, b[1] - ay
+    px, py = point[0] - ax, point[1] - ay
+    length_sq = vx * vx + vy * vy
+    t = min(max((vx * px + vy * py) / length_sq, 0), 1) if length_sq else 0
+    return math.hypot(px - vx * t, py - vy * t)
+
+# turns the cursor positions of one pencil stroke into a simplified polyline as it's drawn,
+# so a stroke's size depends on its shape and not on how long the mouse was held down.
+# add() takes every cursor position and returns the vertices that just became final,
+# the part after the last of those is only a preview until finish()
+class StrokeBuilder:
+    def __init__(self, spacing=STROKE_SPACING, tolerance=STROKE_TOLERANCE):
+        self.spacing = spacing
+        self.tolerance = tolerance
+        self.vertices = []
+        self.pending = []
+        self.last = None
+        self._travelled = 0
+
+    def add(self, pos):
+        pos = (float(pos[0]), float(pos[1]))
+        if self.last is None:
+            self.last = pos
+            self.vertices.append(pos)
+            return [pos]
+
+        added = []
+        for point in self._resample(pos):
+            self.pending.append(point)
+            if len(self.pending) > MAX_PENDING or not self._fits():
+                # the newest point broke the line, the one before it is a corner. it's a
+                # vertex straight away, so the points after it are measured from it
+                self.vertices.append(self.pending[-2])
+                added.append(self.pending[-2])
+                self.pending = self.pending[-1:]
+        return added
+
+    # the rest of the stroke up to where the cursor let go
+    def finish(self):
+        if self.last is None or self.last == self.vertices[-1]:
+            return []
+        # the points still pending have to fit the last segment as well, or the newest of
+        # them is one more corner
+        added = []
+        self.pending.append(self.last)
+        if not self._fits():
+            self.vertices.append(self.pending[-2])
+            added.append(self.pending[-2])
+        self.vertices.append(self.last)
+        added.append(self.last)
+        self.pending = []
+        return added
+
+    # points every `spacing` along the cursor's path from the last position to pos
+    def _resample(self, pos):
+        (lx, ly), (x, y) = self.last, pos
+        length = math.hypot(x - lx, y - ly)
+        points = []
+        d = self.spacing - self._travelled
+        while d <= length:
+            points.append((lx + (x - lx) * d / length, ly + (y - ly) * d / length))
+            d += self.spacing
+        self._travelled = length - (d - self.spacing)
+        self.last = pos
+        return points
+
+    # whether every pending point is within tolerance of the line from the last vertex
+    # to the newest one
+    def _fits(self):
+        a, b = self.vertices[-1], self.pending[-1]
+        return all(_segment_distance(point, a, b) <= self.tolerance for point in self.pending[:-1])
@@ -0,0 +1,107 @@
+import argparse
+import csv
+import itertools
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from physics import Ball, Simulation, G, FRICTION, RHO, TIMESTEP
+from track import Track, load_track
+from world import run_bounds, track_bounds
+
+# parameters a sweep can vary and their defaults, matching the edit screen
+PARAMS = {'g': G, 'friction': FRICTION, 'rho': RHO, 'x': 0.0, 'y': 0.0, 'xvel': 0.0, 'yvel': 0.0, 'radius': 20.0}
+# the edit screen's size, by default a run ends a screen past the track's edges like it does there
+SCREEN = (1000, 800)
+
+# every combination of the given values, unlisted parameters keep their default
+def configurations(values):
+    unknown = set(values) - set(PARAMS)
+    if unknown:
+        raise ValueError(f'unknown sweep parameters {sorted(unknown)}, expected some of {list(PARAMS)}')
+
+    names = list(PARAMS)
+    grid = [values.get(name, [PARAMS[name]]) for name in names]
+    return [dict(zip(names, combo)) for combo in itertools.product(*grid)]
+
+# one run in its own Simulation, so the constants never leak between runs. bounds is
+# (width, height) from the origin or (left, top, right, bottom), None to go by the track
+def run_one(points, config, dt=TIMESTEP, max_time=60, bounds=None, trajectory=False):
+    if bounds is None:
+        bounds = run_bounds(track_bounds(points), (0, 0), SCREEN)
+    ball = Ball(config['radius'], (config['x'], config['y']), (config['xvel'], config['yvel']), None)
+    sim = Simulation(points, ball, config['g'], config['friction'], config['rho'], bounds=bounds, timestep=dt)
+
+    max_speed = np.hypot(ball.xvel, ball.yvel)
+    path = [(0, ball.x, ball.y, ball.xvel, ball.yvel)] if trajectory else None
+    max_steps = int(round(max_time / dt))
+    while sim.running and sim.steps < max_steps:
+        sim.step(dt)
+        max_speed = max(max_speed, np.hypot(ball.xvel, ball.yvel))
+        if trajectory:
+            path.append((sim.time, ball.x, ball.y, ball.xvel, ball.yvel))
+
+    result = dict(config)
+    result.update(time_to_exit=None if sim.running else sim.time, max_speed=float(max_speed),
+                  steps=sim.steps, final_x=float(ball.x), final_y=float(ball.y))
+    if trajectory:
+        result['trajectory'] = np.array(path)
+    return result
+
+_tracks = {}
+
+# each worker process opens a track file once and keeps it for the rest of its runs,
+# binary tracks stay memory mapped instead of being copied into every job
+def open_track(path):
+    if path not in _tracks:
+        _tracks[path] = load_track(path) if str(path).endswith('.json') else Track.load(path)
+    return _tracks[path]
+
+def _run_job(job):
+    points, *args = job
+    if isinstance(points, str):
+        points = open_track(points)
+    return run_one(points, *args)
+
+# runs every configuration across a process pool, results come back in configuration order.
+# points is a track, point list or the path of a track file
+def sweep(points, values, workers=None, dt=TIMESTEP, max_time=60, bounds=None, trajectories=False):
+    jobs = [(points, config, dt, max_time, bounds, trajectories) for config in configurations(values)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_run_job, jobs, chunksize=max(1, len(jobs) // (4 * (workers or 8)))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a track under a grid of constants and initial conditions.')
+    parser.add_argument('track', help='track file saved from the edit screen')
+    for name, default in PARAMS.items():
+        parser.add_argument(f'--{name}', type=float, nargs='+', default=[default], help=f'values to try (default {default})')
+    parser.add_argument('--dt', type=float, default=TIMESTEP, help='physics step in seconds')
+    parser.add_argument('--max-time', type=float, default=60, help='simulated seconds before a run is cut off')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--json', action='store_true', help='write results as json instead of csv')
+    parser.add_argument('--trajectories', metavar='NPZ', help='also save every trajectory to this .npz file')
+    parser.add_argument('--out', help='results file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    values = {name: getattr(args, name) for name in PARAMS}
+    results = sweep(args.track, values, args.workers, args.dt, args.max_time, trajectories=bool(args.trajectories))
+
+    if args.trajectories:
+        np.savez_compressed(args.trajectories, **{f'run_{i}': result.pop('trajectory') for i, result in enumerate(results)})
+
+    out = open(args.out, 'w', newline='') if args.out else sys.stdout
+    try:
+        if args.json:
+            json.dump(results, out, indent=2)
+        else:
+            writer = csv.DictWriter(out, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+    finally:
+        if args.out:
+            out.close()
+
+if __name__ == '__main__':
+    main()
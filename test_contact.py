@@ -0,0 +1,49 @@
+import numpy as np
+from batch import BallBatch, BatchSimulation
+from physics import INTEGRATORS, Ball, Simulation
+
+# headless checks that a rolling ball stays on the near side of whatever it runs into
+
+WHITE = (255, 255, 255)
+BOUNDS = (-1000, -1000, 10000, 10000)
+STEPS = 2400
+
+V = [[[3, WHITE], (100, 200), (500, 700), (900, 200)]]
+RAMP_AND_WALL = [[[3, WHITE], (100, 200), (600, 500)], [[3, WHITE], (600, 520), (600, 100)]]
+
+
+def test_ball_settles_in_a_v():
+    for integrator in INTEGRATORS:
+        for x in (250, 300, 450):
+            ball = Ball(10, (x, 100), (0, 0), None)
+            Simulation(V, ball, bounds=BOUNDS, integrator=integrator).run(1/240, STEPS)
+            assert not ball.freefall
+            assert abs(ball.x - 500) < 2 and 670 < ball.y < 690, (integrator, x, ball.x, ball.y)
+
+
+def test_ball_stops_against_a_wall():
+    for integrator in INTEGRATORS:
+        ball = Ball(10, (150, 100), (0, 0), None)
+        Simulation(RAMP_AND_WALL, ball, friction=0.3, bounds=BOUNDS, integrator=integrator).run(1/240, STEPS)
+        assert not ball.freefall
+        assert abs(ball.x - 588) < 2 and abs(ball.y - 478) < 4, (integrator, ball.x, ball.y)
+
+
+def test_fast_ball_stays_on_its_side_of_a_wall():
+    ball = Ball(10, (150, 160), (4000, 2400), None)
+    Simulation(RAMP_AND_WALL, ball, bounds=BOUNDS).run(1/240, STEPS)
+    assert ball.x < 600
+
+
+def test_batch_holds_in_a_v():
+    x = np.linspace(120, 880, 200)
+    balls = BallBatch(np.stack((x, np.full_like(x, 100)), axis=1), (0, 0), 10)
+    BatchSimulation(V, balls, bounds=BOUNDS).run(1/240, STEPS)
+    assert balls.active.all() and not balls.freefall.any()
+    assert (balls.y < 690).all()
+
+
+def test_batch_stops_against_a_wall():
+    balls = BallBatch([(150, 100)], (0, 0), 10)
+    BatchSimulation(RAMP_AND_WALL, balls, friction=0.3, bounds=BOUNDS).run(1/240, STEPS)
+    assert abs(balls.x[0] - 588) < 2 and abs(balls.y[0] - 478) < 4
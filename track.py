@@ -0,0 +1,111 @@
+import json
+import numpy as np
+
+# binary track file layout, all little endian:
+#   8 byte magic, uint32 version, uint32 spare, uint64 point count, uint64 stroke count
+#   int64   offsets[strokes + 1]   where each stroke's points start, the last is the point count
+#   float32 points[points, 2]
+#   float32 thickness[strokes]
+#   uint8   color[strokes, 4]
+# every block is a multiple of 4 bytes and offsets come first, so each array is aligned
+# and can be memory mapped in place
+MAGIC = b'PSBTRACK'
+VERSION = 1
+HEADER = np.dtype([('magic', 'S8'), ('version', '<u4'), ('spare', '<u4'), ('points', '<u8'), ('strokes', '<u8')])
+
+def _rgba(color):
+    color = tuple(int(c) for c in color)
+    return color + (255,) * (4 - len(color))
+
+# a track as flat contiguous arrays instead of edit()'s lists of tuples
+class Track:
+    def __init__(self, points, offsets, thickness, color):
+        self.points = points
+        self.offsets = offsets
+        self.thickness = thickness
+        self.color = color
+
+    @classmethod
+    def from_points(cls, points):
+        strokes = [sublist for sublist in points if len(sublist) >= 2]
+        offsets = np.zeros(len(strokes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(sublist) - 1 for sublist in strokes])
+
+        xy = np.array([point for sublist in strokes for point in sublist[1:]], dtype=np.float32).reshape(-1, 2)
+        thickness = np.array([sublist[0][0] for sublist in strokes], dtype=np.float32)
+        color = np.array([_rgba(sublist[0][1]) for sublist in strokes], dtype=np.uint8).reshape(-1, 4)
+        return cls(xy, offsets, thickness, color)
+
+    def __len__(self):
+        return len(self.thickness)
+
+    def stroke(self, i):
+        return self.points[self.offsets[i]:self.offsets[i + 1]]
+
+    # back to the list form edit() works on, colors as (r, g, b, a) tuples
+    def to_points(self):
+        return [[[int(self.thickness[i]), tuple(self.color[i].tolist())]] + [tuple(point) for point in self.stroke(i).tolist()]
+                for i in range(len(self))]
+
+    def save(self, path):
+        header = np.zeros(1, dtype=HEADER)
+        header[0] = (MAGIC, VERSION, 0, len(self.points), len(self))
+        with open(path, 'wb') as file:
+            for array, dtype in ((header, HEADER), (self.offsets, '<i8'), (self.points, '<f4'),
+                                 (self.thickness, '<f4'), (self.color, 'u1')):
+                file.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+    # with mmap the arrays are read only views of the file, paged in as they're used
+    @classmethod
+    def load(cls, path, mmap=True):
+        header = np.fromfile(path, dtype=HEADER, count=1)
+        if len(header) == 0 or header['magic'][0] != MAGIC:
+            raise ValueError(f'{path} is not a track file')
+        if header['version'][0] != VERSION:
+            raise ValueError(f'{path} is track format version {header["version"][0]}, expected {VERSION}')
+
+        n_points, n_strokes = int(header['points'][0]), int(header['strokes'][0])
+        layout = (('<i8', (n_strokes + 1,)), ('<f4', (n_points, 2)), ('<f4', (n_strokes,)), ('u1', (n_strokes, 4)))
+        arrays = []
+        offset = HEADER.itemsize
+        for dtype, shape in layout:
+            count = int(np.prod(shape))
+            if mmap and count:
+                arrays.append(np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape))
+            else:
+                with open(path, 'rb') as file:
+                    file.seek(offset)
+                    arrays.append(np.fromfile(file, dtype=dtype, count=count).reshape(shape))
+            offset += count * np.dtype(dtype).itemsize
+
+        offsets, points, thickness, color = arrays
+        return cls(points, offsets, thickness, color)
+
+
+# tracks ending in .json are saved as a list of strokes each written as
+# [[thickness, [r, g, b, a]], [x, y], [x, y], ...] like the point lists edit() builds,
+# anything else in the binary format above
+def save_track(points, path):
+    if not str(path).endswith('.json'):
+        Track.from_points(points).save(path)
+        return
+
+    strokes = []
+    for sublist in points:
+        if len(sublist) < 2:
+            continue
+        thickness, color = sublist[0]
+        strokes.append([[int(thickness), [int(c) for c in color]]] + [[float(x), float(y)] for x, y in sublist[1:]])
+
+    with open(path, 'w') as file:
+        json.dump(strokes, file)
+
+# colors come back as (r, g, b, a) tuples, which pygame accepts anywhere it takes a Color
+def load_track(path):
+    if not str(path).endswith('.json'):
+        return Track.load(path, mmap=False).to_points()
+
+    with open(path) as file:
+        strokes = json.load(file)
+
+    return [[[stroke[0][0], tuple(stroke[0][1])]] + [tuple(point) for point in stroke[1:]] for stroke in strokes]
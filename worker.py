@@ -0,0 +1,110 @@
+import threading
+import time
+
+import numpy as np
+from batch import BatchSimulation
+from profiler import Profiler
+
+# steps a Simulation or BatchSimulation on its own thread at a fixed rate kept in time with
+# the wall clock. it isn't parallel, a single ball steps in plain python floats and holds
+# the GIL all the way through. what it buys is that steps run while the render loop sleeps
+# in clock.tick or waits in pygame calls instead of at the start of each frame, so the
+# frame's own work doesn't include them. after each batch of steps the balls' positions go
+# into one of two slots, the one the reader isn't meant to be on, and then the slot number
+# is published. readers copy the published slot and check the writer hasn't come back
+# round to it, so neither side ever waits on a lock
+class PhysicsWorker:
+    def __init__(self, sim, timestep=None, max_substeps=None):
+        self.sim = sim
+        self.timestep = timestep or sim.timestep
+        self.max_substeps = max_substeps or sim.max_substeps
+
+        # the profiler isn't thread safe, so a profiled sim times its steps into one of the
+        # worker's own, a frame per batch of steps, which goes back into the sim's on stop()
+        self.profiler = None
+        self._sim_profiler = sim.profiler
+        if sim.profiler.enabled:
+            self.profiler = Profiler(history=sim.profiler.frames.maxlen * self.max_substeps)
+            sim.profiler = self.profiler
+
+        # each slot holds rows of x and y before and after the last step and whether each
+        # ball is still in the run, plus the wall clock time it was filled at
+        count = len(sim.balls) if isinstance(sim, BatchSimulation) else 1
+        self._slots = [(np.zeros((5, count)), np.zeros(1)) for _ in range(2)]
+        # last slot number published and the one being filled, slot n is _slots[n % 2]
+        self._published = 0
+        self._writing = 0
+        self._publish()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def running(self):
+        return self._thread.is_alive() or (self.sim.running and not self._stop.is_set())
+
+    def start(self):
+        self._thread.start()
+
+    # stops stepping and waits for the step in progress, the sim can be read safely after
+    # and its own profiler has the timings of the steps taken on the thread
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if self.profiler is not None:
+            self.profiler.frame()
+            self.sim.profiler = self._sim_profiler
+            self._sim_profiler.merge(self.profiler)
+            self.profiler = None
+
+    # the latest positions blended between the two steps either side of now, as x and y
+    # arrays and a bool array of the balls still in the run
+    def positions(self):
+        while True:
+            number = self._published
+            rows, stamp = self._slots[number % 2]
+            rows, stamp = rows.copy(), float(stamp[0])
+            if self._writing < number + 2:
+                break
+
+        alpha = min(max((time.perf_counter() - stamp) / self.timestep, 0), 1)
+        x = rows[0] + (rows[2] - rows[0]) * alpha
+        y = rows[1] + (rows[3] - rows[1]) * alpha
+        return x, y, rows[4] > 0
+
+    def _publish(self):
+        sim = self.sim
+        number = self._published + 1
+        self._writing = number
+        rows, stamp = self._slots[number % 2]
+        if isinstance(sim, BatchSimulation):
+            rows[0], rows[1] = sim.prev_x, sim.prev_y
+            rows[2], rows[3] = sim.balls.x, sim.balls.y
+            rows[4] = sim.balls.active
+        else:
+            rows[:, 0] = sim.prev_x, sim.prev_y, sim.ball.x, sim.ball.y, sim.running
+        stamp[0] = time.perf_counter()
+        self._published = number
+
+    def _run(self):
+        sim = self.sim
+        due = time.perf_counter()
+        while sim.running and not self._stop.is_set():
+            wait = due - time.perf_counter()
+            if wait > 0:
+                self._stop.wait(wait)
+                continue
+
+            substeps = 0
+            while sim.running and due <= time.perf_counter() and substeps < self.max_substeps:
+                sim.step(self.timestep)
+                due += self.timestep
+                substeps += 1
+
+            # too far behind to catch up, the sim slows down rather than taking ever more steps
+            if substeps == self.max_substeps:
+                due = max(due, time.perf_counter())
+            self._publish()
+            if self.profiler is not None:
+                self.profiler.frame()
@@ -0,0 +1,136 @@
+import math
+import numpy as np
+from track import Track, _rgba
+
+# side of the square chunks a world is split into, in px
+CHUNK_SIZE = 512
+# chunks either side of the ball's own one that are kept loaded for collision
+STREAM_RADIUS = 1
+
+# the box (left, top, right, bottom) a track's lines cover, thickness included, or None
+# when it has no lines. points is a point list or a Track
+def track_bounds(points):
+    track = points if isinstance(points, Track) else Track.from_points(points)
+    lengths = np.diff(track.offsets)
+    lines = np.repeat(lengths >= 2, lengths)
+    if not lines.any():
+        return None
+    xy = np.asarray(track.points, dtype=float)[lines]
+    pad = np.repeat(np.asarray(track.thickness, dtype=float) / 2, lengths)[lines, np.newaxis]
+    return (*(xy - pad).min(axis=0), *(xy + pad).max(axis=0))
+
+# where a run ends: a screen of `size` past the far edges of the track's bounds, or off
+# the view at (left, top) a run starts from when there is no track
+def run_bounds(bounds, view, size):
+    width, height = size
+    left, top = view
+    right, bottom = left + width, top + height
+    if bounds is not None:
+        left, top = min(left, float(bounds[0]) - width), min(top, float(bounds[1]) - height)
+        right, bottom = max(right, float(bounds[2]) + width), max(bottom, float(bounds[3]) + height)
+    return left, top, right, bottom
+
+# a track in world coordinates split into square chunks. every segment is filed under
+# the chunks its bounding box touches, so the part of the track around a point can be
+# cut out without going through the rest of it, however long the track is. version is
+# passed on to track_geometry() with each chunk, so pieces of an unchanged track are
+# found in its cache without hashing them, None when nothing keeps track of changes
+class ChunkedTrack:
+    def __init__(self, points, chunk_size=CHUNK_SIZE, version=None):
+        self.chunk_size = chunk_size
+        self.version = version
+
+        # each stroke's points with repeats dropped, so segment numbers stay the same
+        # in every piece cut out of it
+        self.strokes = []
+        self.thickness = []
+        self.color = []
+        for sublist in points:
+            if len(sublist) < 3:
+                continue
+            point_list = np.array(sublist[1:], dtype=float)
+            point_list = point_list[np.append(True, np.any(np.diff(point_list, axis=0) != 0, axis=1))]
+            if len(point_list) < 2:
+                continue
+            self.strokes.append(point_list)
+            self.thickness.append(float(sublist[0][0]))
+            self.color.append(_rgba(sublist[0][1]))
+
+        # (stroke, segment) pairs sorted by the chunk they're in, and where each chunk's run starts and ends
+        stroke_ids, seg_ids, chunk_x, chunk_y = [], [], [], []
+        self.bounds = None
+        for s, point_list in enumerate(self.strokes):
+            pad = self.thickness[s] / 2
+            lo = np.minimum(point_list[:-1], point_list[1:]) - pad
+            hi = np.maximum(point_list[:-1], point_list[1:]) + pad
+            c0 = np.floor(lo / chunk_size).astype(np.int64)
+            c1 = np.floor(hi / chunk_size).astype(np.int64)
+
+            nx = c1[:, 0] - c0[:, 0] + 1
+            ny = c1[:, 1] - c0[:, 1] + 1
+            cover = nx * ny
+            segs = np.repeat(np.arange(len(cover)), cover)
+            local = np.arange(cover.sum()) - np.repeat(np.cumsum(cover) - cover, cover)
+            stroke_ids.append(np.full(len(segs), s))
+            seg_ids.append(segs)
+            chunk_x.append(c0[segs, 0] + local % nx[segs])
+            chunk_y.append(c0[segs, 1] + local // nx[segs])
+
+            box = (*lo.min(axis=0), *hi.max(axis=0))
+            self.bounds = box if self.bounds is None else (min(self.bounds[0], box[0]), min(self.bounds[1], box[1]),
+                                                           max(self.bounds[2], box[2]), max(self.bounds[3], box[3]))
+
+        self.chunks = {}
+        if stroke_ids:
+            stroke_ids, seg_ids = np.concatenate(stroke_ids), np.concatenate(seg_ids)
+            chunk_x, chunk_y = np.concatenate(chunk_x), np.concatenate(chunk_y)
+            order = np.lexsort((seg_ids, stroke_ids, chunk_y, chunk_x))
+            self._stroke_ids, self._seg_ids = stroke_ids[order], seg_ids[order]
+            keys = np.stack((chunk_x[order], chunk_y[order]), axis=1)
+            uniq, first = np.unique(keys, axis=0, return_index=True)
+            last = np.append(first[1:], len(keys))
+            self.chunks = {(int(cx), int(cy)): (int(a), int(b)) for (cx, cy), a, b in zip(uniq, first, last)}
+
+    def __len__(self):
+        return len(self.strokes)
+
+    def chunk_of(self, x, y):
+        return math.floor(x / self.chunk_size), math.floor(y / self.chunk_size)
+
+    # the loaded chunks around the chunk a point is in
+    def block(self, x, y, radius=STREAM_RADIUS):
+        return self.blocks([self.chunk_of(x, y)], radius)
+
+    # the loaded chunks around any of the given chunks, sorted so the same chunks always
+    # come out the same
+    def blocks(self, chunks, radius=STREAM_RADIUS):
+        return tuple(sorted({(cx + i, cy + j) for cx, cy in chunks for i in range(-radius, radius + 1)
+                             for j in range(-radius, radius + 1) if (cx + i, cy + j) in self.chunks}))
+
+    # the segments filed under the given chunks as a Track, each unbroken run of a stroke
+    # becoming one curve, and the (stroke, first segment) each curve was cut from
+    def extract(self, keys):
+        runs = [self.chunks[key] for key in keys if key in self.chunks]
+        if not runs:
+            return Track(np.zeros((0, 2)), np.zeros(1, dtype=np.int64), np.zeros(0), np.zeros((0, 4), dtype=np.uint8)), np.zeros((0, 2), dtype=int)
+
+        stroke_ids = np.concatenate([self._stroke_ids[a:b] for a, b in runs])
+        seg_ids = np.concatenate([self._seg_ids[a:b] for a, b in runs])
+        pairs = np.unique(np.stack((stroke_ids, seg_ids), axis=1), axis=0)
+
+        # a new curve wherever the stroke changes or a segment is skipped
+        breaks = np.flatnonzero((np.diff(pairs[:, 0]) != 0) | (np.diff(pairs[:, 1]) != 1)) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.append(breaks, len(pairs))
+
+        pieces, origins = [], []
+        for a, b in zip(starts, ends):
+            s, first = int(pairs[a, 0]), int(pairs[a, 1])
+            pieces.append(self.strokes[s][first:int(pairs[b - 1, 1]) + 2])
+            origins.append((s, first))
+
+        offsets = np.concatenate(([0], np.cumsum([len(piece) for piece in pieces]))).astype(np.int64)
+        origins = np.array(origins, dtype=int)
+        thickness = np.array(self.thickness)[origins[:, 0]]
+        color = np.array(self.color, dtype=np.uint8)[origins[:, 0]]
+        return Track(np.concatenate(pieces), offsets, thickness, color), origins